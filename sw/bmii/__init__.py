@@ -1,2 +1,22 @@
-from bmii.bmii import *
-from bmii.ioctl import *
+# The full API (migen, IO controller elaboration, simulation test cases) is
+# only loaded on first use, so that bmii.regmap and bmii.usbctl stay cheap
+# to import for the CLI fast path.
+import importlib
+
+
+def __getattr__(name):
+    if name.startswith("__") and name != "__all__":
+        raise AttributeError("module 'bmii' has no attribute '{}'".format(name))
+
+    g = globals()
+    if "__all__" not in g:
+        for m in [importlib.import_module("bmii.bmii"),
+                importlib.import_module("bmii.ioctl"),
+                importlib.import_module("bmii.pool")]:
+            g.update([(n, getattr(m, n)) for n in dir(m)
+                if not n.startswith("_")])
+        g["__all__"] = [n for n in g if not n.startswith("_")]
+
+    if name not in g:
+        raise AttributeError("module 'bmii' has no attribute '{}'".format(name))
+    return g[name]
@@ -1,8 +1,13 @@
-from bmii import *
+from bmii.cli import fast_cli, make_parser, parse_args
 
 def main():
+    parser, subparser = make_parser()
+    args = parse_args(parser)
+    if fast_cli(args):
+        return
+    from bmii.bmii import BMII
     b = BMII.default()
-    b.cli()
+    b.cli(args)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,141 @@
+import logging
+import time
+
+from bmii.usbctl.drv import CPUSpd
+
+BURST_SIZES = [1, 16, 64, 512, 4096]
+EVENT_TIMEOUT = 1000
+
+
+def percentile(samples, p):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, len(samples) * p // 100)]
+
+
+def summarize(samples, size=0):
+    total = sum(samples)
+    res = {
+        "ops": len(samples),
+        "ops_per_s": round(len(samples) / total, 1),
+        "mean_us": round(total * 1e6 / len(samples), 1),
+        "p50_us": round(percentile(samples, 50) * 1e6, 1),
+        "p99_us": round(percentile(samples, 99) * 1e6, 1),
+    }
+    if size:
+        res["bytes"] = size
+        res["bytes_per_s"] = round(size * len(samples) / total, 1)
+    return res
+
+
+class Benchmark():
+    def __init__(self, bmii, iterations=256, sizes=BURST_SIZES):
+        self.bmii = bmii
+        self.drv = bmii.usbctl.drv
+        self.nb = bmii.modules.northbridge.drv
+        self.iterations = iterations
+        self.sizes = sizes
+
+    def timed(self, func, n=None):
+        samples = []
+        for i in range(self.iterations if n is None else n):
+            start = time.perf_counter()
+            func(i)
+            samples.append(time.perf_counter() - start)
+        return samples
+
+    def burst_iterations(self, size):
+        return max(4, self.iterations * 64 // max(64, size))
+
+    def reg_read(self):
+        return summarize(self.timed(lambda i: int(self.nb.SCRATCH)))
+
+    def reg_write(self):
+        return summarize(self.timed(lambda i: self.nb.SCRATCH.write(i & 0xFF)))
+
+    def scratch_loop(self):
+        errors = []
+
+        def loop(i):
+            self.nb.SCRATCH = i & 0xFF
+            if int(self.nb.SCRATCH) != i & 0xFF:
+                errors.append(i)
+
+        res = summarize(self.timed(loop))
+        res["errors"] = len(errors)
+        return res
+
+    def burst_read(self):
+        res = {}
+        for size in self.sizes:
+            res[str(size)] = summarize(self.timed(
+                lambda i: self.nb.SCRATCH.read_burst(size),
+                self.burst_iterations(size)), size)
+        return res
+
+    def burst_write(self):
+        res = {}
+        for size in self.sizes:
+            data = bytes([i & 0xFF for i in range(size)])
+            res[str(size)] = summarize(self.timed(
+                lambda i: self.nb.SCRATCH.write_burst(data),
+                self.burst_iterations(size)), size)
+        return res
+
+    def field_rmw(self):
+        sb = self.bmii.modules.southbridge
+        if sb.iomodule.shadowed:
+            return None
+        reg = sb.drv.PINOUTMISC
+        saved = int(reg)
+        try:
+            return summarize(self.timed(
+                lambda i: setattr(reg, "LED1", i & 1)))
+        finally:
+            reg.write(saved)
+
+    def event_latency(self):
+        nb = self.bmii.modules.northbridge.iomodule
+        if not hasattr(nb.intrs, "SWINT"):
+            return None
+        evt = next(i + 1 for i, intr in enumerate(nb.interrupts.intrs)
+                if intr is nb.intrs.SWINT)
+        self.drv.enable_event_ep()
+
+        def roundtrip(i):
+            self.nb.SWINT = 1
+            if evt not in self.drv.wait_events(EVENT_TIMEOUT):
+                raise IOError("Software interrupt not delivered")
+            self.nb.EOI = evt
+
+        try:
+            self.drv.get_events()
+            return summarize(self.timed(roundtrip))
+        finally:
+            self.drv.enable_event_ep(False)
+
+    def run_suite(self):
+        res = {}
+        for name in ["reg_read", "reg_write", "scratch_loop", "burst_read",
+                "burst_write", "field_rmw", "event_latency"]:
+            logging.info("Running %s...", name)
+            res[name] = getattr(self, name)()
+        return res
+
+    def run(self, speeds=None):
+        if speeds is None:
+            speeds = list(CPUSpd)
+        self.drv.attach()
+        res = {
+            "backend": type(self.drv.transport).__name__,
+            "timestamp": time.time(),
+            "iterations": self.iterations,
+            "speeds": {},
+        }
+        try:
+            for spd in speeds:
+                logging.info("Benchmarking at %sHz", spd.name[-3:])
+                self.drv.set_cpu_speed(spd)
+                res["speeds"][spd.name[-3:]] = self.run_suite()
+        finally:
+            self.drv.set_cpu_speed(CPUSpd.CLK_12M)
+        return res
@@ -1,68 +1,204 @@
-import argparse
+from concurrent.futures import ThreadPoolExecutor
 import importlib
+import json
 import logging
 import sys
+import threading
 import time
 import unittest
 
+from bmii.bench import Benchmark, BURST_SIZES
+from bmii.cli import list_boards, load_script, make_parser, parse_args, \
+        setup_logging, use_daemon
 from bmii.ioctl import *
 from bmii.usbctl import *
+from bmii.usbctl.daemon import Daemon, DaemonTransport
+from bmii.usbctl.sim import SimTransport
+from bmii.usbctl.stats import Stats
 from bmii.test import *
 
 
+def creg_fields(creg):
+    return sorted([f for f in creg.__dict__.values()
+        if isinstance(f, CtrlRegField)], key=lambda f: f.offset)
+
+
+def compile_field(field):
+    offset = field.offset
+    mask = ((1 << field.size) - 1) << offset
+
+    def fget(self):
+        return (self.read_value() & mask) >> offset
+
+    def fset(self, value):
+        self.write_masked(mask, value << offset)
+
+    return property(fget, fset)
+
+
 class DrvCReg():
+    __slots__ = ("usbctl", "creg", "addr", "mask")
+
     def __init__(self, usbctl, creg):
-        object.__setattr__(self, "usbctl", usbctl)
-        object.__setattr__(self, "creg", creg)
+        self.usbctl = usbctl
+        self.creg = creg
+        self.addr = usbctl.drv.creg_addr(creg)
+        self.mask = (1 << len(creg)) - 1
 
-    def __getattr__(self, field):
-        field = getattr(self.creg, field)
-        value = self.read(1)
-        return (value >> field.offset) & ((1 << field.size) - 1)
+    @classmethod
+    def compile(cls, usbctl, creg):
+        attrs = {"__slots__": ()}
+        for field in creg_fields(creg):
+            if not hasattr(cls, field.name):
+                attrs[field.name] = compile_field(field)
+        return type(cls.__name__ + creg.name, (cls,), attrs)(usbctl, creg)
+
+    def update(self, **fields):
+        mask = 0
+        bits = 0
+        for name, value in fields.items():
+            field = getattr(self.creg, name)
+            fmask = ((1 << field.size) - 1) << field.offset
+            mask |= fmask
+            bits = (bits & ~fmask) | ((value << field.offset) & fmask)
+        self.write_masked(mask, bits)
+
+    def write_masked(self, mask, bits):
+        drv = self.usbctl.drv
+        with drv.lock:
+            v = 0
+            if mask != self.mask:
+                v = drv.shadow_value(self.creg)
+                if v is None:
+                    v = self.read_value()
+            self.write((v & ~mask) | (bits & mask))
+
+    def read_value(self):
+        if self.usbctl.drv.cmds is not None:
+            raise IOError("{}: value needed inside a batch but not shadowed".\
+                    format(self.creg.name))
+        return self.read(1)
 
-    def __setattr__(self, field, value):
-        field = getattr(self.creg, field)
-        v = self.read(1)
-        mask = ~(((1 << field.size) - 1) << field.offset)
-        self.write((v & mask) | ((value & ((1 << field.size) - 1)) << field.offset))
+    def fields(self):
+        value = self.read_value()
+        return dict([(f.name, (value >> f.offset) & ((1 << f.size) - 1))
+            for f in creg_fields(self.creg)])
 
     def select(self):
-        self.usbctl.drv.select_creg(self.creg)
+        self.usbctl.drv.select_creg(self.creg, self.addr)
 
     def read(self, size):
-        self.select()
-        return self.usbctl.drv.read(size)
+        with self.usbctl.drv.lock:
+            self.select()
+            return self.usbctl.drv.read(size)
 
     def write(self, value):
-        self.select()
-        self.usbctl.drv.write(value)
+        with self.usbctl.drv.lock:
+            self.select()
+            self.usbctl.drv.write(value)
+
+    def wait_for(self, mask, value, timeout=None):
+        drv = self.usbctl.drv
+        start = time.monotonic()
+        while True:
+            result = drv.poll(self.creg, mask, value)
+            if drv.cmds is not None:
+                return result
+            if result.matched:
+                return result.value
+            if timeout is not None and time.monotonic() - start > timeout:
+                raise TimeoutError("{}: timeout waiting for {:#x} (mask {:#x})".\
+                        format(self.creg.name, value, mask))
+
+    def invalidate(self):
+        self.usbctl.drv.invalidate_shadow(self.creg)
+
+    def read_burst(self, size):
+        return self.usbctl.drv.read_burst(self.creg, size)
+
+    def write_burst(self, data):
+        self.usbctl.drv.write_burst(self.creg, data)
 
     def __int__(self):
         return self.read(1)
 
 
 class Driver():
+    __slots__ = ("bmii_module",)
+
     def __init__(self, bmii_module):
         object.__setattr__(self, "bmii_module", bmii_module)
 
+    @classmethod
+    def compile(cls, bmii_module):
+        attrs = {"__slots__": ()}
+        for creg in bmii_module.iomodule.cregs.__dict__.values():
+            if not isinstance(creg, CtrlReg) or hasattr(cls, creg.name):
+                continue
+            drv_creg = DrvCReg.compile(bmii_module.usbctl, creg)
+            if bmii_module.iomodule.shadowed:
+                attrs[creg.name] = property(
+                        lambda self, r=drv_creg: self.check_shadowed() or r)
+            else:
+                attrs[creg.name] = drv_creg
+        return type(bmii_module.iomodule.name + cls.__name__, (cls,),
+                attrs)(bmii_module)
+
     def check_shadowed(self):
         if self.bmii_module.iomodule.shadowed:
             logging.warning("Module shadowed: operations on control registers are useless")
 
     def __getattr__(self, creg_name):
-        self.check_shadowed()
-        return DrvCReg(self.bmii_module.usbctl,
-                getattr(self.bmii_module.iomodule.cregs, creg_name))
+        # Control register added after the accessors were compiled
+        creg = getattr(self.bmii_module.iomodule.cregs, creg_name, None)
+        if not isinstance(creg, CtrlReg):
+            raise AttributeError("{} has no control register {}".\
+                    format(self.bmii_module.iomodule.name, creg_name))
+        return getattr(self.bmii_module.compile_drv(), creg_name)
 
     def __setattr__(self, creg_name, value):
+        getattr(self, creg_name).write(value)
+
+    def batch(self):
+        return self.bmii_module.usbctl.drv.batch()
+
+    def snapshot(self, *creg_names):
+        self.check_shadowed()
+        cregs = self.bmii_module.iomodule.cregs
+        if creg_names:
+            regs = [getattr(cregs, n) for n in creg_names]
+        else:
+            regs = sorted([r for r in cregs.__dict__.values()
+                if isinstance(r, CtrlReg) and r.direction != CtrlRegDir.WRONLY],
+                key=lambda r: r.addr)
+        drv = self.bmii_module.usbctl.drv
+        if drv.cmds is not None:
+            raise IOError("{}: snapshot cannot be taken inside a batch".\
+                    format(self.bmii_module.iomodule.name))
+        values = drv.read_many(regs)
+        return dict(zip([r.name for r in regs], values))
+
+    def read_block(self, creg_name, count):
+        self.check_shadowed()
+        creg = getattr(self.bmii_module.iomodule.cregs, creg_name)
+        return self.bmii_module.usbctl.drv.read_block(creg, count)
+
+    def write_block(self, creg_name, data):
         self.check_shadowed()
-        creg = DrvCReg(self.bmii_module.usbctl,
-                getattr(self.bmii_module.iomodule.cregs, creg_name))
-        creg.write(value)
+        creg = getattr(self.bmii_module.iomodule.cregs, creg_name)
+        self.bmii_module.usbctl.drv.write_block(creg, data)
+
+    def invalidate(self, *creg_names):
+        cregs = self.bmii_module.iomodule.cregs
+        if not creg_names:
+            creg_names = [r.name for r in cregs.__dict__.values()
+                    if isinstance(r, CtrlReg)]
+        for name in creg_names:
+            self.bmii_module.usbctl.drv.invalidate_shadow(getattr(cregs, name))
 
     def get_creg(self, creg_name):
         try:
-            return self.__getattr__(creg_name)
+            return getattr(self, creg_name)
         except AttributeError:
             logging.error("Cannot find control register %s", creg_name)
             sys.exit(2)
@@ -105,6 +241,10 @@ class BMIIModule():
                 intr.handlers.append(f)
                 self.interrupt_handlers[f.intr] = f
 
+    def compile_drv(self):
+        self.drv = Driver.compile(self)
+        return self.drv
+
     def run_tests(self):
         logging.info("Simulating %s", self.iomodule.name)
         for ts in self.test_suite:
@@ -124,6 +264,7 @@ class BMIIModules():
 
     def __iadd__(self, module):
         module.usbctl = self.usbctl
+        module.compile_drv()
         object.__setattr__(self, module.iomodule.name, module)
         return self
 
@@ -144,107 +285,35 @@ class BMIIModules():
             sys.exit(2)
 
 class BMII():
-    def __init__(self, shrink=False):
-        self.usbctl = USBCtl()
+    def __init__(self, shrink=False, device=None):
+        self.usbctl = USBCtl(device)
         self.ioctl = IOCtl(shrink)
 
         self.modules = BMIIModules(self.usbctl)
+        self.event_thread = None
 
         self.modules += BMIIModule(self.ioctl.nb,
                 test_nb.NorthBridgeUSBCTLCase,
                 test_nb.NorthBridgeIOModuleCase)
         self.modules += BMIIModule(self.ioctl.sb, test_sb.SouthBridgeCase)
 
-        self.parser = argparse.ArgumentParser(description="BMII CLI")
-        self.parser.add_argument('--verbose', '-v', action='count', default=0)
-        self.parser.add_argument("-m", action="append",
-                help="Add module to BMII", default=[])
-        self.parser.set_defaults(action="")
-        self.subparser = self.parser.add_subparsers()
-
-        def auto_int(nb):
-            return int(nb, 0)
-
-        detect_parser = self.subparser.add_parser(
-                name="detect",
-                help="Detect plugged BMII")
-        detect_parser.set_defaults(action="detect")
-
-        build_parser = self.subparser.add_parser(
-                name="build",
-                description="Build BMII design/firmware",
-                help="build/program BMII design")
-        build_parser.add_argument("buildtype",
-                choices=["all", "ioctl", "usbctl", "ub"],
-                default="all")
-        build_parser.set_defaults(action="build")
-
-        program_parser = self.subparser.add_parser(
-                name="program",
-                description="Program BMII",
-                help="Program BMII")
-        program_parser.add_argument("buildtype",
-                choices=["all", "ioctl", "usbctl", "ub", "eeprom"],
-                default="all")
-        program_parser.set_defaults(action="program")
-
-        simulate_parser = self.subparser.add_parser(
-                name="simulate",
-                help="simulate IOModule unit tests")
-        simulate_parser.add_argument("module", type=str)
-        simulate_parser.set_defaults(action="simulate")
-
-        test_parser = self.subparser.add_parser(
-                name="test",
-                help="test BMII device")
-        test_parser.set_defaults(action="test")
-
-        set_parser = self.subparser.add_parser(
-                name="set",
-                help="write IOModule control register")
-        set_parser.add_argument("module", type=str)
-        set_parser.add_argument("reg", type=str)
-        set_parser.add_argument("value", type=auto_int)
-        set_parser.set_defaults(action="set")
-
-        get_parser = self.subparser.add_parser(
-                name="get",
-                help="read IOModule control register")
-        get_parser.add_argument("module", type=str)
-        get_parser.add_argument("reg", type=str)
-        get_parser.set_defaults(action="get")
-
-        clk_parser = self.subparser.add_parser(
-                name="clk",
-                help="set clock speed")
-        clk_parser.add_argument("clk",
-                choices=["12M", "24M", "48M"])
-        clk_parser.set_defaults(action="clk")
-
-        info_parser = self.subparser.add_parser(
-                name="info",
-                help="display BMII configuration")
-        info_parser.set_defaults(action="info")
-
-        eval_parser = self.subparser.add_parser(
-                name="eval",
-                help="evaluate python expression")
-        eval_parser.add_argument("cmd", type=str)
-        eval_parser.set_defaults(action="eval")
-
-        run_parser = self.subparser.add_parser(
-                name="run",
-                help="Poll and handle intrrupts")
-        run_parser.set_defaults(action="run")
+        self.parser, self.subparser = make_parser()
 
     def add_module(self, module):
         logging.debug("Adding module: %s", module.iomodule.name)
-        self.modules += module
         self.ioctl += module.iomodule
+        self.modules += module
 
     def run_tests(self):
         self.modules.run_tests()
 
+    def find_creg(self, module, creg_name):
+        m = getattr(self.modules, module, None)
+        if not isinstance(m, BMIIModule):
+            return None
+        creg = getattr(m.iomodule.cregs, creg_name, None)
+        return creg if isinstance(creg, CtrlReg) else None
+
     def build_all(self):
         self.usbctl.ubfw.build()
         self.usbctl.fw.build()
@@ -309,35 +378,30 @@ class BMII():
         self.usbctl.drv.attach()
 
         logging.debug("Testing Northbridge...")
-        for i in range(256):
-            self.modules.northbridge.drv.SCRATCH = i
-            v = int(self.modules.northbridge.drv.SCRATCH)
-            if v != i:
-                logging.error("SCRATCH register: wrote %x, read %x", i, v)
+        with self.usbctl.drv.operation("BMII.test"):
+            for i in range(256):
+                self.modules.northbridge.drv.SCRATCH = i
+                v = int(self.modules.northbridge.drv.SCRATCH)
+                if v != i:
+                    logging.error("SCRATCH register: wrote %x, read %x", i, v)
 
         logging.info("Device fully tested")
 
-    def cli(self):
-        if len(sys.argv) == 1:
-            self.parser.print_help()
-            sys.exit(1)
-
-        for handler in logging.root.handlers[:]:
-            logging.root.removeHandler(handler)
-
-        args = self.parser.parse_args()
-
-        loglevels = [logging.WARN, logging.INFO, logging.DEBUG]
-        if args.verbose >= len(loglevels):
-            args.verbose = len(loglevels) - 1
-
-        logging.basicConfig(stream=sys.stderr, level=loglevels[args.verbose],
-                format='[%(levelname)s] %(message)s')
+    def stats(self, cmd=None):
+        drv = self.usbctl.drv
+        drv.enable_stats()
+        drv.reset_stats()
+        if cmd is None:
+            self.test()
+        else:
+            with drv.operation("eval"):
+                eval(cmd)
+        Stats.dump(drv.stats())
 
-        logging.addLevelName(logging.DEBUG,   "\033[1;34mDEBUG\033[1;0m")
-        logging.addLevelName(logging.INFO,    "\033[1;32mINFO\033[1;0m")
-        logging.addLevelName(logging.WARNING, "\033[1;33mWARN\033[1;0m")
-        logging.addLevelName(logging.ERROR,   "\033[1;31mERROR\033[1;0m")
+    def cli(self, args=None):
+        if args is None:
+            args = parse_args(self.parser)
+        setup_logging(args.verbose)
 
         for m in args.m:
             spec = importlib.util.spec_from_file_location("bmii.modules", m)
@@ -350,6 +414,17 @@ class BMII():
             for i in mod.bmii_modules:
                 i.default(self)
 
+        if args.device is not None:
+            self.usbctl.set_device(args.device)
+
+        if args.swint or args.sim:
+            self.ioctl.nb.add_swint()
+
+        if args.sim:
+            self.usbctl.drv.set_transport(SimTransport(self.ioctl))
+        elif use_daemon(args):
+            self.usbctl.drv.set_transport(DaemonTransport(args.socket))
+
         if args.action == "get":
             drv = self.modules.get_module(args.module).drv
             cr = drv.get_creg(args.reg)
@@ -373,11 +448,15 @@ class BMII():
                             self.usbctl.drv.dev.address))
             except IOError as e:
                 logging.error("%s", e)
+        elif args.action == "list":
+            list_boards()
         elif args.action == "build":
             if args.buildtype == "all":
                 self.build_all()
             elif args.buildtype == "ioctl":
                 self.ioctl.build()
+            elif args.buildtype == "manifest":
+                self.ioctl.write_manifest(args.manifest)
             elif args.buildtype == "usbctl":
                 self.usbctl.fw.build()
             elif args.buildtype == "ub":
@@ -407,26 +486,100 @@ class BMII():
             print(eval(args.cmd))
         elif args.action == "run":
             self.run()
+        elif args.action == "daemon":
+            try:
+                Daemon(self.usbctl.drv, args.socket).serve_forever()
+            except KeyboardInterrupt:
+                pass
+        elif args.action == "bench":
+            speeds = None
+            if args.speed:
+                speeds = [CPUSpd["CLK_" + spd] for spd in args.speed]
+            res = Benchmark(self, args.iterations,
+                    args.size or BURST_SIZES).run(speeds)
+            if args.output:
+                with open(args.output, "w") as f:
+                    json.dump(res, f, indent=2)
+            else:
+                print(json.dumps(res, indent=2))
+        elif args.action == "stats":
+            self.stats(args.cmd)
+        elif args.action == "batch":
+            script = load_script(args)
+            try:
+                script.resolve(self.find_creg)
+            except IOError as e:
+                logging.error("%s", e)
+                sys.exit(2)
+            if not script.run(self.usbctl.drv, dict(globals(), self=self),
+                    not args.serial):
+                sys.exit(1)
 
         self.args = args
 
+    def dispatch_event(self, evt):
+        if evt == 0:
+            logging.warning("Received spurious interrupt")
+            return False
+        logging.debug("Received interrupt #%d", evt)
+        handlers = self.modules.northbridge.iomodule.interrupts.get_handlers(evt)
+        for handler in handlers:
+            handler(self)
+        return True
+
+    def dispatch_events(self, evts):
+        eois = bytes([evt for evt in evts if self.dispatch_event(evt)])
+        if eois:
+            self.modules.northbridge.drv.EOI.write_burst(eois)
+
     def handle_interrupts(self):
-        evt = self.usbctl.drv.get_event()
-        if evt == 0xFF:
+        self.dispatch_events(self.usbctl.drv.get_events())
+
+    def service_event(self, evt):
+        try:
+            self.dispatch_event(evt)
+        except Exception:
+            logging.exception("Interrupt #%d handler failed", evt)
+        finally:
+            if evt != 0:
+                self.modules.northbridge.drv.EOI = evt
+            self.event_slots.release()
+
+    def event_loop(self, timeout):
+        drv = self.usbctl.drv
+        while not self.event_stop.is_set():
+            for evt in drv.wait_events(int(timeout * 1000)):
+                self.event_slots.acquire()
+                self.event_pool.submit(self.service_event, evt)
+
+    def start_event_loop(self, workers=4, backlog=32, timeout=0.25):
+        if self.event_thread is not None:
             return
-        elif evt == 0:
-            logging.warning("Received spurious interrupt")
-        else:
-            logging.debug("Received interrupt #%d", evt)
-            handlers = self.modules.northbridge.iomodule.interrupts.get_handlers(evt)
-            for handler in handlers:
-                handler(self)
-            self.modules.northbridge.drv.EOI = evt
-
-    def run(self, interval=0.25):
-        while (True):
-            self.handle_interrupts()
-            time.sleep(interval)
+        self.event_stop = threading.Event()
+        self.event_slots = threading.BoundedSemaphore(backlog)
+        self.event_pool = ThreadPoolExecutor(max_workers=workers)
+        self.usbctl.drv.enable_event_ep()
+        self.event_thread = threading.Thread(target=self.event_loop,
+                args=(timeout,), name="bmii-events", daemon=True)
+        self.event_thread.start()
+
+    def stop_event_loop(self):
+        if self.event_thread is None:
+            return
+        self.event_stop.set()
+        self.event_thread.join()
+        self.event_thread = None
+        self.event_pool.shutdown()
+        self.usbctl.drv.enable_event_ep(False)
+
+    def run(self, timeout=0.25):
+        drv = self.usbctl.drv
+        drv.enable_event_ep()
+        try:
+            while (True):
+                self.dispatch_events(drv.wait_events(int(timeout * 1000)))
+        finally:
+            drv.enable_event_ep(False)
 
     @classmethod
     def default(cls):
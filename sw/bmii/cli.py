@@ -0,0 +1,275 @@
+import argparse
+import logging
+import sys
+
+from bmii.regmap import RegMap
+from bmii.script import Script
+from bmii.usbctl.daemon import DaemonTransport
+from bmii.usbctl.drv import CPUSpd, Driver
+from bmii.usbctl.transport import USBTransport, list_devices
+
+# Actions served from the register manifest, without elaborating the design
+FAST_ACTIONS = ["get", "set", "detect", "list", "clk", "run", "batch"]
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(description="BMII CLI")
+    parser.add_argument('--verbose', '-v', action='count', default=0)
+    parser.add_argument("-m", action="append",
+            help="Add module to BMII", default=[])
+    parser.add_argument("--sim", action="store_true",
+            help="Use a simulated device instead of the hardware")
+    parser.add_argument("--swint", action="store_true",
+            help="Add the northbridge software interrupt used by 'bench'")
+    parser.add_argument("--device", type=str, default=None,
+            help="board USB port path (1-2.3), bus:address or serial number")
+    parser.add_argument("--manifest", type=str, default=None,
+            help="register manifest written by 'bmii build'")
+    parser.add_argument("--socket", type=str, default=None,
+            help="bmii daemon socket path")
+    parser.add_argument("--no-daemon", action="store_true",
+            help="Access the device directly even if a daemon is running")
+    parser.set_defaults(action="")
+    subparser = parser.add_subparsers()
+
+    def auto_int(nb):
+        return int(nb, 0)
+
+    detect_parser = subparser.add_parser(
+            name="detect",
+            help="Detect plugged BMII")
+    detect_parser.set_defaults(action="detect")
+
+    list_parser = subparser.add_parser(
+            name="list",
+            help="List plugged BMIIs")
+    list_parser.set_defaults(action="list")
+
+    build_parser = subparser.add_parser(
+            name="build",
+            description="Build BMII design/firmware",
+            help="build/program BMII design")
+    build_parser.add_argument("buildtype",
+            choices=["all", "ioctl", "usbctl", "ub", "manifest"],
+            default="all")
+    build_parser.set_defaults(action="build")
+
+    program_parser = subparser.add_parser(
+            name="program",
+            description="Program BMII",
+            help="Program BMII")
+    program_parser.add_argument("buildtype",
+            choices=["all", "ioctl", "usbctl", "ub", "eeprom"],
+            default="all")
+    program_parser.set_defaults(action="program")
+
+    simulate_parser = subparser.add_parser(
+            name="simulate",
+            help="simulate IOModule unit tests")
+    simulate_parser.add_argument("module", type=str)
+    simulate_parser.set_defaults(action="simulate")
+
+    test_parser = subparser.add_parser(
+            name="test",
+            help="test BMII device")
+    test_parser.set_defaults(action="test")
+
+    set_parser = subparser.add_parser(
+            name="set",
+            help="write IOModule control register")
+    set_parser.add_argument("module", type=str)
+    set_parser.add_argument("reg", type=str)
+    set_parser.add_argument("value", type=auto_int)
+    set_parser.set_defaults(action="set")
+
+    get_parser = subparser.add_parser(
+            name="get",
+            help="read IOModule control register")
+    get_parser.add_argument("module", type=str)
+    get_parser.add_argument("reg", type=str)
+    get_parser.set_defaults(action="get")
+
+    clk_parser = subparser.add_parser(
+            name="clk",
+            help="set clock speed")
+    clk_parser.add_argument("clk",
+            choices=["12M", "24M", "48M"])
+    clk_parser.set_defaults(action="clk")
+
+    info_parser = subparser.add_parser(
+            name="info",
+            help="display BMII configuration")
+    info_parser.set_defaults(action="info")
+
+    eval_parser = subparser.add_parser(
+            name="eval",
+            help="evaluate python expression")
+    eval_parser.add_argument("cmd", type=str)
+    eval_parser.set_defaults(action="eval")
+
+    run_parser = subparser.add_parser(
+            name="run",
+            help="Poll and handle intrrupts")
+    run_parser.set_defaults(action="run")
+
+    daemon_parser = subparser.add_parser(
+            name="daemon",
+            help="serve the device to other bmii processes")
+    daemon_parser.set_defaults(action="daemon")
+
+    bench_parser = subparser.add_parser(
+            name="bench",
+            help="benchmark register and burst transfers")
+    bench_parser.add_argument("-n", "--iterations", type=int, default=256)
+    bench_parser.add_argument("-b", "--size", type=int, action="append",
+            help="burst size in bytes (default: 1, 16, 64, 512, 4096)")
+    bench_parser.add_argument("-s", "--speed", action="append",
+            choices=["12M", "24M", "48M"],
+            help="CPU clock to benchmark at (default: all)")
+    bench_parser.add_argument("-o", "--output", type=str,
+            help="write JSON results to file")
+    bench_parser.set_defaults(action="bench")
+
+    stats_parser = subparser.add_parser(
+            name="stats",
+            help="report USB transfer statistics")
+    stats_parser.add_argument("cmd", type=str, nargs="?",
+            help="python expression to profile (default: device test)")
+    stats_parser.set_defaults(action="stats")
+
+    batch_parser = subparser.add_parser(
+            name="batch",
+            help="run a get/set/wait/sleep/eval script in one session")
+    batch_parser.add_argument("file", type=str,
+            help="script file, '-' for stdin")
+    batch_parser.add_argument("--serial", action="store_true",
+            help="run commands one by one for per-command timings")
+    batch_parser.set_defaults(action="batch")
+
+    return parser, subparser
+
+
+def parse_args(parser):
+    if len(sys.argv) == 1:
+        parser.print_help()
+        sys.exit(1)
+    return parser.parse_args()
+
+
+def load_script(args):
+    try:
+        return Script.load(args)
+    except IOError as e:
+        logging.error("%s", e)
+        sys.exit(2)
+
+
+def setup_logging(verbose):
+    for handler in logging.root.handlers[:]:
+        logging.root.removeHandler(handler)
+
+    loglevels = [logging.WARN, logging.INFO, logging.DEBUG]
+    logging.basicConfig(stream=sys.stderr,
+            level=loglevels[min(verbose, len(loglevels) - 1)],
+            format='[%(levelname)s] %(message)s')
+
+    logging.addLevelName(logging.DEBUG,   "\033[1;34mDEBUG\033[1;0m")
+    logging.addLevelName(logging.INFO,    "\033[1;32mINFO\033[1;0m")
+    logging.addLevelName(logging.WARNING, "\033[1;33mWARN\033[1;0m")
+    logging.addLevelName(logging.ERROR,   "\033[1;31mERROR\033[1;0m")
+
+
+def use_daemon(args):
+    # The daemon serves a single board: only use it for another one when
+    # its socket is given explicitly
+    if args.device is not None and args.socket is None:
+        return False
+    return args.action != "daemon" and not args.no_daemon and \
+            DaemonTransport.available(args.socket)
+
+
+def list_boards():
+    for dev in list_devices():
+        print("Path: {}, Bus: {}, Address: {}, Serial: {}".format(
+            dev["path"], dev["bus"], dev["address"], dev["serial"] or "-"))
+
+
+def run_events(drv, regmap, timeout=0.25):
+    eoi = regmap.creg("northbridge", "EOI")
+    drv.enable_event_ep()
+    try:
+        while (True):
+            evts = []
+            for evt in drv.wait_events(int(timeout * 1000)):
+                if evt == 0:
+                    logging.warning("Received spurious interrupt")
+                    continue
+                logging.debug("Received interrupt #%d (%s)", evt,
+                        regmap.interrupt_name(evt))
+                evts.append(evt)
+            if evts:
+                drv.write_burst(eoi, bytes(evts))
+    finally:
+        drv.enable_event_ep(False)
+
+
+def fast_cli(args):
+    if args.action not in FAST_ACTIONS or args.m or args.sim:
+        return False
+
+    setup_logging(args.verbose)
+
+    regmap = None
+    creg = None
+    script = None
+    if args.action == "batch":
+        script = load_script(args)
+        if script.needs_eval():
+            return False
+    if args.action in ["get", "set", "run", "batch"]:
+        try:
+            regmap = RegMap.load(args.manifest)
+        except IOError as e:
+            logging.debug("%s", e)
+            return False
+    if args.action in ["get", "set"]:
+        creg = regmap.creg(args.module, args.reg)
+        if creg is None:
+            return False
+        if creg.iomodule.shadowed:
+            logging.warning("Module shadowed: operations on control registers are useless")
+    if script is not None:
+        try:
+            script.resolve(regmap.creg)
+        except IOError as e:
+            logging.debug("%s", e)
+            return False
+
+    if args.action == "list":
+        list_boards()
+        return True
+
+    drv = Driver(USBTransport(device=args.device))
+    if use_daemon(args):
+        drv.set_transport(DaemonTransport(args.socket))
+
+    if args.action == "get":
+        drv.select_creg(creg)
+        print(hex(drv.read(1)))
+    elif args.action == "set":
+        drv.select_creg(creg)
+        drv.write(args.value)
+    elif args.action == "clk":
+        drv.set_cpu_speed(CPUSpd["CLK_" + args.clk])
+    elif args.action == "detect":
+        try:
+            drv.attach()
+            print("Bus: {}, Address: {}".format(drv.dev.bus, drv.dev.address))
+        except IOError as e:
+            logging.error("%s", e)
+    elif args.action == "run":
+        run_events(drv, regmap)
+    elif args.action == "batch":
+        if not script.run(drv, pipeline=not args.serial):
+            sys.exit(1)
+    return True
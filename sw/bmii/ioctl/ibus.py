@@ -1,10 +1,17 @@
 from migen import *
 
+from bmii.regmap import MADDR_WIDTH, RADDR_WIDTH
+
 IBus = [
-        ("maddr",   3, DIR_M_TO_S),
-        ("raddr",   5, DIR_M_TO_S),
+        ("maddr",   MADDR_WIDTH, DIR_M_TO_S),
+        ("raddr",   RADDR_WIDTH, DIR_M_TO_S),
         ("wr",      1, DIR_M_TO_S),
         ("req",     1, DIR_M_TO_S),
+        # Pulses when a new register is selected
+        ("latch",   1, DIR_M_TO_S),
         ("mosi",    8, DIR_M_TO_S),
         ("miso",    8, DIR_S_TO_M),
+        # Active when the addressed register cannot take or provide data
+        # yet: a ready line would not OR across the slaves
+        ("stall",   1, DIR_S_TO_M),
 ]
@@ -9,6 +9,23 @@ from bmii.ioctl.iomodule import *
 from bmii.ioctl.platform import BMIIPlatform
 from bmii.ioctl.north_bridge import NorthBridge
 from bmii.ioctl.south_bridge import SouthBridge
+from bmii.regmap import RegMap, MANIFEST_VERSION, MADDR_WIDTH, paged
+
+
+def logic_elements(build_dir="build", build_name="top"):
+    # "Total logic elements : 412 / 570 ( 72 % )" in the fitter summary
+    path = os.path.join(build_dir, build_name + ".fit.summary")
+    try:
+        with open(path) as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name.strip() == "Total logic elements":
+                    used, _, total = value.split("(")[0].partition("/")
+                    return int(used.replace(",", "")), \
+                            int(total.replace(",", ""))
+    except (OSError, ValueError):
+        pass
+    return None
 
 
 class IOModules():
@@ -17,6 +34,11 @@ class IOModules():
         self.bridges = bridges
 
     def __iadd__(self, iomodule):
+        # The northbridge answers to module 0 of every page
+        if self.modules_nb and not paged(self.modules_nb):
+            self.modules_nb += 1
+        if self.modules_nb >= 1 << MADDR_WIDTH:
+            raise ValueError("Too many IO modules")
         iomodule.set_addr(self.modules_nb)
         object.__setattr__(self, iomodule.name, iomodule)
         for bridge in self.bridges:
@@ -26,8 +48,8 @@ class IOModules():
 
 
 class IOCtl(Module):
-    def __init__(self, shrink=False):
-        self.nb = NorthBridge("northbridge")
+    def __init__(self, shrink=False, swint=False):
+        self.nb = NorthBridge("northbridge", swint=swint)
         self.sb = SouthBridge("southbridge", shadowed=shrink)
 
         self.iomodules = IOModules([self.nb])
@@ -42,8 +64,50 @@ class IOCtl(Module):
         self.submodules.__setattr__(iomodule.name, iomodule)
         return self
 
+    def manifest(self):
+        iomodules = sorted([m for m in self.iomodules.__dict__.values()
+            if isinstance(m, IOModule)], key=lambda m: m.addr)
+
+        modules = []
+        for m in iomodules:
+            cregs = []
+            for r in sorted([r for r in m.cregs.__dict__.values()
+                    if isinstance(r, CtrlReg)], key=lambda r: r.addr):
+                cregs.append({
+                    "name": r.name,
+                    "addr": r.addr,
+                    "direction": r.direction.name,
+                    "cached": r.cached,
+                    "width": r.width,
+                    "fields": dict([(f.name, [f.offset, f.size])
+                        for f in r.__dict__.values()
+                        if isinstance(f, CtrlRegField)]),
+                })
+            modules.append({
+                "name": m.name,
+                "addr": m.addr,
+                "shadowed": m.shadowed,
+                "cregs": cregs,
+            })
+
+        interrupts = []
+        for intr in self.nb.interrupts.intrs:
+            module = next(m for m in iomodules
+                    if getattr(m.intrs, intr.name, None) is intr)
+            interrupts.append({"module": module.name, "name": intr.name})
+
+        return {
+            "version": MANIFEST_VERSION,
+            "modules": modules,
+            "interrupts": interrupts,
+        }
+
+    def write_manifest(self, path=None):
+        RegMap.save(self.manifest(), path)
+
     def build(self):
         logging.debug("Building IO controller design...")
+        self.write_manifest()
         plat = BMIIPlatform()
         self.nb.connect_platform(plat)
         self.sb.connect_platform(plat)
@@ -56,8 +120,16 @@ class IOCtl(Module):
         self.submodules.crg = CRG(plat.request("clk2"),
                 ~plat.request("reset0") | ~plat.request("reset1"))
 
+        before = logic_elements()
         plat.build(self)
         logging.info("IO controller design built")
+
+        after = logic_elements()
+        if after is not None:
+            logging.info("Logic elements: %d / %d", *after)
+            if before is not None:
+                logging.info("Logic elements before this build: %d (%+d)",
+                        before[0], after[0] - before[0])
         return plat
 
     def detect(self):
@@ -2,6 +2,7 @@ from enum import Enum
 from migen import *
 
 from bmii.ioctl.ibus import IBus
+from bmii.regmap import CtrlRegDir, RADDR_WIDTH
 from bmii.ioctl.utils import *
 
 REGSIZE = 8
@@ -17,23 +18,32 @@ class CtrlRegField(Signal):
         return "<CtrlRegField " + self.name + " at " + hex(id(self)) + ">"
 
 
-class CtrlRegDir(Enum):
-    RDONLY  = 0
-    WRONLY  = 1
-    RDWR    = 2
-
-
 class CtrlReg(Signal):
-    def __init__(self, name, direction):
+    def __init__(self, name, direction, cached=False, width=REGSIZE):
+        if width <= 0 or width % REGSIZE:
+            raise ValueError("{}: width must be a multiple of {}".\
+                    format(name, REGSIZE))
         self.name = name
+        self.width = width
         self.addr = 0
         self.direction = direction
+        # Only written by the host: reads can be served from the driver cache
+        self.cached = cached
         self.iomodule = None
         self.wr = Signal()
         self.wr_pulse = Signal()
         self.rd = Signal()
         self.rd_pulse = Signal()
-        Signal.__init__(self, REGSIZE, name)
+        self.ready = None
+        self.max_stall = None
+        Signal.__init__(self, width, name)
+
+    def stall_until(self, ready, max_cycles=None):
+        # Data transfers to this register wait for ready, so that the host
+        # does not have to poll a status register first. max_cycles bounds
+        # how long ready can stay low once the register is in use.
+        self.ready = ready
+        self.max_stall = max_cycles
 
     def __setitem__(self, key, value):
         n = len(self)
@@ -68,31 +78,105 @@ class CtrlRegs(Module):
         self.select = select
         self.reg_nb = 0
         self.iomodule = iomodule
+        self.raddr = ibus.raddr
+        self.hits = []
+
+    def do_finalize(self):
+        # One-hot register decoder shared by all control registers
+        self.comb += Case(self.raddr,
+                dict([(creg.addr, hit.eq(1)) for creg, hit, en in self.hits]))
+
+        stalls = []
+        for creg, hit, en in self.hits:
+            if creg.ready is None:
+                self.comb += en.eq(hit)
+            else:
+                # A stalled register ignores the strobe
+                self.comb += en.eq(hit & creg.ready)
+                stalls.append(hit & ~creg.ready)
+        if stalls:
+            self.comb += self.ibus.stall.eq(self.iomodule.addressed
+                    & reduce(or_, stalls))
 
     def __iadd__(self, creg):
+        if self.reg_nb >= 1 << len(self.raddr):
+            raise ValueError("{}: too many control registers".\
+                    format(self.iomodule.name))
         creg.cregs = self
         creg.addr = self.reg_nb
         creg.iomodule = self.iomodule
+        hit = Signal()
+        en = Signal()
+        self.hits.append((creg, hit, en))
+
+        if creg.width > REGSIZE:
+            self.add_lanes(creg, en)
+        else:
+            self.add_byte(creg, en)
+
+        object.__setattr__(self, creg.name, creg)
+        self.reg_nb += 1
+        return self
+
+    def values(self):
+        return [creg for creg, hit, en in self.hits]
 
+    def add_byte(self, creg, en):
         if (creg.direction in [CtrlRegDir.WRONLY, CtrlRegDir.RDWR]):
             self.comb += creg.wr.eq(self.select
                     & self.ibus.wr
-                    & (self.ibus.raddr == creg.addr))
-            self.submodules += NLevelToPulse(creg.wr, creg.wr_pulse)
+                    & en)
+            self.submodules += FallingEdge(creg.wr, creg.wr_pulse)
             self.sync += If(creg.wr,
                     creg.eq(self.ibus.mosi))
 
         if (creg.direction in [CtrlRegDir.RDONLY, CtrlRegDir.RDWR]):
             self.comb += creg.rd.eq(self.select
                     & ~self.ibus.wr
-                    & (self.ibus.raddr == creg.addr))
-            self.submodules += LevelToPulse(creg.rd, creg.rd_pulse)
+                    & en)
+            # Once the host has sampled the register
+            self.submodules += FallingEdge(creg.rd, creg.rd_pulse)
             self.comb += If(creg.rd,
                     self.ibus.miso.eq(creg))
 
-        object.__setattr__(self, creg.name, creg)
-        self.reg_nb += 1
-        return self
+    def add_lanes(self, creg, en):
+        # Wide registers are transferred a byte at a time, least significant
+        # first, from the select on. Reads return a snapshot taken before
+        # the first byte, writes take effect with the last one.
+        nlanes = creg.width // REGSIZE
+        lane = Signal(max=nlanes)
+        last = Signal()
+        lane_wr = Signal()
+        lane_rd = Signal()
+        lane_end = Signal()
+        self.comb += last.eq(lane == nlanes - 1)
+        self.comb += lane_wr.eq(self.select & self.ibus.wr & en)
+        self.comb += lane_rd.eq(self.select & ~self.ibus.wr & en)
+        self.submodules += FallingEdge(lane_wr | lane_rd, lane_end)
+        self.sync += If(self.ibus.latch,
+                lane.eq(0)).\
+            Elif(lane_end,
+                If(last, lane.eq(0)).Else(lane.eq(lane + 1)))
+
+        if (creg.direction in [CtrlRegDir.WRONLY, CtrlRegDir.RDWR]):
+            staging = Signal(creg.width - REGSIZE)
+            cases = dict([(i, staging[i * REGSIZE:(i + 1) * REGSIZE].\
+                    eq(self.ibus.mosi)) for i in range(nlanes - 1)])
+            cases[nlanes - 1] = creg.eq(Cat(staging, self.ibus.mosi))
+            self.comb += creg.wr.eq(lane_wr & last)
+            self.submodules += FallingEdge(creg.wr, creg.wr_pulse)
+            self.sync += If(lane_wr, Case(lane, cases))
+
+        if (creg.direction in [CtrlRegDir.RDONLY, CtrlRegDir.RDWR]):
+            snapshot = Signal(creg.width)
+            self.sync += If((lane == 0) & ~lane_rd & ~lane_end,
+                    snapshot.eq(creg))
+            self.comb += creg.rd.eq(lane_rd & last)
+            self.submodules += FallingEdge(creg.rd, creg.rd_pulse)
+            self.comb += If(lane_rd,
+                    self.ibus.miso.eq(Array([
+                        snapshot[i * REGSIZE:(i + 1) * REGSIZE]
+                        for i in range(nlanes)])[lane]))
 
 
 class IOSignalDir(Enum):
@@ -154,6 +238,7 @@ class IOModule(Module):
         self.ibus = Record(IBus)
 
         self.select = Signal()
+        self.addressed = Signal()
 
         self.cregs = CtrlRegs(self, self.ibus, self.select)
         self.submodules += self.cregs
@@ -167,8 +252,8 @@ class IOModule(Module):
     def set_addr(self, addr):
         self.addr = addr
         if not self.shadowed:
-            self.comb += self.select.eq(self.ibus.req &
-                    (self.ibus.maddr == self.addr))
+            self.comb += self.addressed.eq(self.ibus.maddr == self.addr)
+            self.comb += self.select.eq(self.ibus.req & self.addressed)
 
     def __repr__(self):
         return "<IOModule " + self.name + "@" + hex(self.addr) + " at " + hex(id(self)) + ">"
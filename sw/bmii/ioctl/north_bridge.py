@@ -3,6 +3,9 @@ from migen.genlib.coding import PriorityEncoder
 
 from bmii.ioctl.iomodule import *
 from bmii.ioctl.ibus import IBus
+from bmii.regmap import SELECT_MADDR_BITS, SELECT_RADDR_BITS, \
+        PAGE_MADDR_BITS, PAGE_RADDR_BITS, PAGE_SELECT, PAGE_AUTOINC, \
+        STALL_TIMEOUT
 
 FD_WIDTH    = 8
 INTR_WIDTH  = 2
@@ -45,9 +48,12 @@ class IntCircuit(Module):
 
 
 class NorthBridge(IOModule):
-    def __init__(self, name):
+    def __init__(self, name, stall_timeout=STALL_TIMEOUT, swint=False):
         IOModule.__init__(self, name)
         self.ibus_slaves = []
+        self.slaves = []
+        self.stall_timeout = stall_timeout
+        self.cregs.raddr = self.ibus.raddr[:SELECT_RADDR_BITS]
 
         self.cregs += CtrlReg("IDCODE", CtrlRegDir.RDONLY)
         self.comb += self.cregs.IDCODE.eq(0xA5)
@@ -71,20 +77,45 @@ class NorthBridge(IOModule):
         self.interrupts = IntCircuit()
         self.submodules += self.interrupts
         self.comb += self.intr[0].eq(~self.interrupts.intr)
-        self.comb += self.interrupts.ack.eq(self.la & self.act)
+        self.comb += self.interrupts.ack.eq(self.la & self.act & ~self.wr)
         self.comb += self.interrupts.eoi_request.eq(self.cregs.EOI.wr_pulse)
         self.comb += self.interrupts.eoi_number.eq(self.cregs.EOI)
 
+        # Extended addressing: high bits of the module and register
+        # addresses, latched along with the next select byte. The
+        # northbridge itself ignores them so that PAGE stays reachable.
+        self.cregs += CtrlReg("PAGE", CtrlRegDir.WRONLY)
+        assert self.cregs.PAGE.addr << SELECT_MADDR_BITS == PAGE_SELECT
+
+        if swint:
+            self.add_swint()
+
         self.sync += self.ifclk.eq(~self.ifclk)
         self.comb += self.ioctl_rdy.eq(~self.act)
 
-        # Latch address
-        self.sync += If(self.act & self.la,
-                self.ibus_m.maddr.eq(self.fdt.i[0:3]),
-                self.ibus_m.raddr.eq(self.fdt.i[3:8]))
+        # Latch address. Interrupt acknowledge cycles are address latch
+        # reads and leave the selected register untouched.
+        autoinc_bit = log2_int(PAGE_AUTOINC)
+        self.autoinc = Signal()
+        data_cycle = Signal()
+        last_data_cycle = Signal()
+        self.comb += data_cycle.eq(self.act & ~self.la)
+        self.sync += last_data_cycle.eq(data_cycle)
+
+        self.sync += If(self.act & self.la & self.wr,
+                self.ibus_m.maddr.eq(Cat(self.fdt.i[:SELECT_MADDR_BITS],
+                    self.cregs.PAGE[:PAGE_MADDR_BITS])),
+                self.ibus_m.raddr.eq(Cat(self.fdt.i[SELECT_MADDR_BITS:],
+                    self.cregs.PAGE[PAGE_MADDR_BITS:
+                        PAGE_MADDR_BITS + PAGE_RADDR_BITS])),
+                self.autoinc.eq(self.cregs.PAGE[autoinc_bit]),
+                self.cregs.PAGE[autoinc_bit].eq(0)).\
+            Elif(self.autoinc & last_data_cycle & ~data_cycle,
+                self.ibus_m.raddr.eq(self.ibus_m.raddr + 1))
 
         # Request IO module
         self.comb += self.ibus_m.req.eq(~self.ioctl_rdy & ~self.la)
+        self.comb += self.ibus_m.latch.eq(self.act & self.la & self.wr)
 
         # Operation type
         self.comb += self.ibus_m.wr.eq(self.wr)
@@ -99,17 +130,49 @@ class NorthBridge(IOModule):
                     self.fdt.o.eq(self.interrupts.intr_number)).\
                 Else(self.fdt.o.eq(self.ibus_m.miso))
 
+    def add_swint(self):
+        # Software interrupt, raised by any write to SWINT. Only meant for
+        # benchmarks and the simulator, it is left out of regular builds.
+        if hasattr(self.intrs, "SWINT"):
+            return
+        self.cregs += CtrlReg("SWINT", CtrlRegDir.WRONLY)
+        self.intrs += IntRequest("SWINT", self.cregs.SWINT.wr_pulse)
+        self.interrupts += self.intrs.SWINT
+
+    def do_finalize(self):
+        # Flow control: the GPIF holds data transfers while the addressed
+        # module stalls them, bounded so that the firmware cannot hang
+        stall_timeout = max([self.stall_timeout] +
+                [creg.max_stall for iomodule in self.slaves
+                    for creg, hit, en in iomodule.cregs.hits
+                    if creg.max_stall is not None])
+        stall_count = Signal(max=stall_timeout + 1)
+        self.sync += If(self.ibus_m.req & self.ibus_m.stall,
+                If(stall_count != stall_timeout,
+                    stall_count.eq(stall_count + 1))).\
+            Else(stall_count.eq(0))
+        self.comb += self.iomodule_rdy.eq(~self.ibus_m.stall
+                | (stall_count == stall_timeout))
+
+    def set_addr(self, addr):
+        self.addr = addr
+        self.comb += self.addressed.eq(
+                self.ibus.maddr[:SELECT_MADDR_BITS] == self.addr)
+        self.comb += self.select.eq(self.ibus.req & self.addressed)
 
     def connect(self, iomodule):
         if not iomodule.shadowed:
             self.ibus_slaves.append(iomodule.ibus)
+            self.slaves.append(iomodule)
 
-    def connect_platform(self, plat):
+    def connect_ibus(self):
         self.comb += self.ibus_m.connect(*self.ibus_slaves)
-        self.specials += self.fdt.get_tristate(plat.request("fd"))
-
         self.interrupts.generate_circuit()
 
+    def connect_platform(self, plat):
+        self.connect_ibus()
+        self.specials += self.fdt.get_tristate(plat.request("fd"))
+
         ctl = plat.request("ctl")
         rdy = plat.request("rdy")
 
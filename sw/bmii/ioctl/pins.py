@@ -74,7 +74,7 @@ class Pins(Module):
 
 
 def define_bmii_pins(cr):
-    cr += CtrlReg("PINDIR1L", CtrlRegDir.RDWR)
+    cr += CtrlReg("PINDIR1L", CtrlRegDir.RDWR, cached=True)
     cr.PINDIR1L[0] = "IO10"
     cr.PINDIR1L[1] = "IO11"
     cr.PINDIR1L[2] = "IO12"
@@ -84,7 +84,7 @@ def define_bmii_pins(cr):
     cr.PINDIR1L[6] = "IO16"
     cr.PINDIR1L[7] = "IO17"
 
-    cr += CtrlReg("PINDIR1H", CtrlRegDir.RDWR)
+    cr += CtrlReg("PINDIR1H", CtrlRegDir.RDWR, cached=True)
     cr.PINDIR1H[0] = "IO18"
     cr.PINDIR1H[1] = "IO19"
     cr.PINDIR1H[2] = "IO1A"
@@ -94,7 +94,7 @@ def define_bmii_pins(cr):
     cr.PINDIR1H[6] = "IO1E"
     cr.PINDIR1H[7] = "IO1F"
 
-    cr += CtrlReg("PINDIR2L", CtrlRegDir.RDWR)
+    cr += CtrlReg("PINDIR2L", CtrlRegDir.RDWR, cached=True)
     cr.PINDIR2L[0] = "IO20"
     cr.PINDIR2L[1] = "IO21"
     cr.PINDIR2L[2] = "IO22"
@@ -104,7 +104,7 @@ def define_bmii_pins(cr):
     cr.PINDIR2L[6] = "IO26"
     cr.PINDIR2L[7] = "IO27"
 
-    cr += CtrlReg("PINDIR2H", CtrlRegDir.RDWR)
+    cr += CtrlReg("PINDIR2H", CtrlRegDir.RDWR, cached=True)
     cr.PINDIR2H[0] = "IO28"
     cr.PINDIR2H[1] = "IO29"
     cr.PINDIR2H[2] = "IO2A"
@@ -159,7 +159,7 @@ def define_bmii_pins(cr):
     cr.PINSCANMISC[1] = "LED1"
     cr.PINSCANMISC[2] = "SW"
 
-    cr += CtrlReg("PINMUX1L", CtrlRegDir.RDWR)
+    cr += CtrlReg("PINMUX1L", CtrlRegDir.RDWR, cached=True)
     cr.PINMUX1L[0] = "IO10"
     cr.PINMUX1L[1] = "IO11"
     cr.PINMUX1L[2] = "IO12"
@@ -169,7 +169,7 @@ def define_bmii_pins(cr):
     cr.PINMUX1L[6] = "IO16"
     cr.PINMUX1L[7] = "IO17"
 
-    cr += CtrlReg("PINMUX1H", CtrlRegDir.RDWR)
+    cr += CtrlReg("PINMUX1H", CtrlRegDir.RDWR, cached=True)
     cr.PINMUX1H[0] = "IO18"
     cr.PINMUX1H[1] = "IO19"
     cr.PINMUX1H[2] = "IO1A"
@@ -179,7 +179,7 @@ def define_bmii_pins(cr):
     cr.PINMUX1H[6] = "IO1E"
     cr.PINMUX1H[7] = "IO1F"
 
-    cr += CtrlReg("PINMUX2L", CtrlRegDir.RDWR)
+    cr += CtrlReg("PINMUX2L", CtrlRegDir.RDWR, cached=True)
     cr.PINMUX2L[0] = "IO20"
     cr.PINMUX2L[1] = "IO21"
     cr.PINMUX2L[2] = "IO22"
@@ -189,7 +189,7 @@ def define_bmii_pins(cr):
     cr.PINMUX2L[6] = "IO26"
     cr.PINMUX2L[7] = "IO27"
 
-    cr += CtrlReg("PINMUX2H", CtrlRegDir.RDWR)
+    cr += CtrlReg("PINMUX2H", CtrlRegDir.RDWR, cached=True)
     cr.PINMUX2H[0] = "IO28"
     cr.PINMUX2H[1] = "IO29"
     cr.PINMUX2H[2] = "IO2A"
@@ -199,7 +199,7 @@ def define_bmii_pins(cr):
     cr.PINMUX2H[6] = "IO2E"
     cr.PINMUX2H[7] = "IO2F"
 
-    cr += CtrlReg("PINDIRMUX1L", CtrlRegDir.RDWR)
+    cr += CtrlReg("PINDIRMUX1L", CtrlRegDir.RDWR, cached=True)
     cr.PINDIRMUX1L[0] = "IO10"
     cr.PINDIRMUX1L[1] = "IO11"
     cr.PINDIRMUX1L[2] = "IO12"
@@ -209,7 +209,7 @@ def define_bmii_pins(cr):
     cr.PINDIRMUX1L[6] = "IO16"
     cr.PINDIRMUX1L[7] = "IO17"
 
-    cr += CtrlReg("PINDIRMUX1H", CtrlRegDir.RDWR)
+    cr += CtrlReg("PINDIRMUX1H", CtrlRegDir.RDWR, cached=True)
     cr.PINDIRMUX1H[0] = "IO18"
     cr.PINDIRMUX1H[1] = "IO19"
     cr.PINDIRMUX1H[2] = "IO1A"
@@ -219,7 +219,7 @@ def define_bmii_pins(cr):
     cr.PINDIRMUX1H[6] = "IO1E"
     cr.PINDIRMUX1H[7] = "IO1F"
 
-    cr += CtrlReg("PINDIRMUX2L", CtrlRegDir.RDWR)
+    cr += CtrlReg("PINDIRMUX2L", CtrlRegDir.RDWR, cached=True)
     cr.PINDIRMUX2L[0] = "IO20"
     cr.PINDIRMUX2L[1] = "IO21"
     cr.PINDIRMUX2L[2] = "IO22"
@@ -229,7 +229,7 @@ def define_bmii_pins(cr):
     cr.PINDIRMUX2L[6] = "IO26"
     cr.PINDIRMUX2L[7] = "IO27"
 
-    cr += CtrlReg("PINDIRMUX2H", CtrlRegDir.RDWR)
+    cr += CtrlReg("PINDIRMUX2H", CtrlRegDir.RDWR, cached=True)
     cr.PINDIRMUX2H[0] = "IO28"
     cr.PINDIRMUX2H[1] = "IO29"
     cr.PINDIRMUX2H[2] = "IO2A"
@@ -239,11 +239,11 @@ def define_bmii_pins(cr):
     cr.PINDIRMUX2H[6] = "IO2E"
     cr.PINDIRMUX2H[7] = "IO2F"
 
-    cr += CtrlReg("PINMUXMISC", CtrlRegDir.RDWR)
+    cr += CtrlReg("PINMUXMISC", CtrlRegDir.RDWR, cached=True)
     cr.PINMUXMISC[0] = "LED0"
     cr.PINMUXMISC[1] = "LED1"
 
-    cr += CtrlReg("PINOUT1L", CtrlRegDir.RDWR)
+    cr += CtrlReg("PINOUT1L", CtrlRegDir.RDWR, cached=True)
     cr.PINOUT1L[0] = "IO10"
     cr.PINOUT1L[1] = "IO11"
     cr.PINOUT1L[2] = "IO12"
@@ -253,7 +253,7 @@ def define_bmii_pins(cr):
     cr.PINOUT1L[6] = "IO16"
     cr.PINOUT1L[7] = "IO17"
 
-    cr += CtrlReg("PINOUT1H", CtrlRegDir.RDWR)
+    cr += CtrlReg("PINOUT1H", CtrlRegDir.RDWR, cached=True)
     cr.PINOUT1H[0] = "IO18"
     cr.PINOUT1H[1] = "IO19"
     cr.PINOUT1H[2] = "IO1A"
@@ -263,7 +263,7 @@ def define_bmii_pins(cr):
     cr.PINOUT1H[6] = "IO1E"
     cr.PINOUT1H[7] = "IO1F"
 
-    cr += CtrlReg("PINOUT2L", CtrlRegDir.RDWR)
+    cr += CtrlReg("PINOUT2L", CtrlRegDir.RDWR, cached=True)
     cr.PINOUT2L[0] = "IO20"
     cr.PINOUT2L[1] = "IO21"
     cr.PINOUT2L[2] = "IO22"
@@ -273,7 +273,7 @@ def define_bmii_pins(cr):
     cr.PINOUT2L[6] = "IO26"
     cr.PINOUT2L[7] = "IO27"
 
-    cr += CtrlReg("PINOUT2H", CtrlRegDir.RDWR)
+    cr += CtrlReg("PINOUT2H", CtrlRegDir.RDWR, cached=True)
     cr.PINOUT2H[0] = "IO28"
     cr.PINOUT2H[1] = "IO29"
     cr.PINOUT2H[2] = "IO2A"
@@ -283,7 +283,7 @@ def define_bmii_pins(cr):
     cr.PINOUT2H[6] = "IO2E"
     cr.PINOUT2H[7] = "IO2F"
 
-    cr += CtrlReg("PINOUTMISC", CtrlRegDir.RDWR)
+    cr += CtrlReg("PINOUTMISC", CtrlRegDir.RDWR, cached=True)
     cr.PINOUTMISC[0] = "LED0"
     cr.PINOUTMISC[1] = "LED1"
 
@@ -1,5 +1,6 @@
 from enum import IntEnum
 from bmii import *
+from bmii.ioctl.testbench import *
 from migen.genlib.fifo import *
 from migen.genlib.fsm import *
 from bitarray import bitarray
@@ -122,6 +123,39 @@ class JTAGIOModule(IOModule):
                 tr("DRSELECT", "IDLE"))
 
 
+class LoopbackJTAGIOModule(JTAGIOModule):
+    def __init__(self):
+        JTAGIOModule.__init__(self, 4)
+        self.comb += self.iosignals.TDO.eq(self.iosignals.TDI)
+
+
+class JTAGTestCase(IOModuleTestCase(LoopbackJTAGIOModule())):
+    def test_rdr(self):
+        def gen():
+            cregs = self.tb.iomodule.cregs
+            # RESET -> IDLE -> DRSELECT -> DRCAPTURE -> DRSHIFT, then shift
+            # TDI 1 and 0. The TDI pin is driven inverted and TDO loops it
+            # straight back, so RDR reads back the complement
+            for tdr in [0, 1, 0, 0, 2, 0]:
+                yield from self.ibus_write_creg(cregs.TDR, tdr)
+                yield
+                yield
+                yield from self.ibus_reset()
+                yield
+
+            # The FIFO is popped once the host is done sampling RDR
+            for rdr in [0b10, 0b11, 0b00]:
+                yield from self.ibus_read_creg(cregs.RDR)
+                for i in range(4):
+                    yield
+                    self.assertEqual((yield self.tb.ibus_m.miso), rdr)
+                yield from self.ibus_reset()
+                yield
+                yield
+
+        self.run_with(gen())
+
+
 class ScanData(bitarray):
     def __int__(self):
         return int(self.to01()[::-1], 2)
@@ -189,21 +223,27 @@ class JTAG(BMIIModule):
         self.trst_enable = trst_enable
         self.current_state = TAPState.RESET
         self.chain = []
-        BMIIModule.__init__(self, JTAGIOModule())
+        BMIIModule.__init__(self, JTAGIOModule(), JTAGTestCase)
 
-    def update_state(self, state):
-        assert int(self.drv.STATE) == state, "S: {}".format(int(self.drv.STATE))
+    def check_state(self, current, state):
+        assert current == state, "S: {}".format(current)
         self.current_state = state
 
+    def update_state(self, state):
+        self.check_state(int(self.drv.STATE), state)
+
     def seq(self, path, state):
-        for i in path:
-            self.drv.TDR = i
-        self.update_state(state)
+        with self.drv.batch():
+            for i in path:
+                self.drv.TDR = i
+            current = self.drv.STATE.read(1)
+        self.check_state(int(current), state)
 
     def shift(self, value):
         value.reverse()
-        for i in range(len(value)):
-            self.drv.TDR = value[i] << 1 | int(i == len(value) - 1)
+        with self.drv.batch():
+            for i in range(len(value)):
+                self.drv.TDR = value[i] << 1 | int(i == len(value) - 1)
 
     def read_rdr(self):
         value = bitarray()
@@ -14,7 +14,7 @@ class Probe:
         self.values = []
 
     def retrieve_values(self, drv, nb):
-        self.values = [int(drv.get_creg(self.name)) for i in range(nb)]
+        self.values = list(drv.get_creg(self.name).read_burst(nb))
 
 
 class LogicAnalyserState(IntEnum):
@@ -90,18 +90,16 @@ class LogicAnalyser(BMIIModule):
         self.drv.START = 0
 
     def capture(self):
-        if int(self.drv.STATUS) == LogicAnalyserState.WAITING:
-            logging.info("Waiting for trigger...")
-            while int(self.drv.STATUS) == LogicAnalyserState.WAITING:
-                pass
+        with self.usbctl.drv.operation("LogicAnalyser.capture"):
+            status = int(self.drv.STATUS)
+            if status == LogicAnalyserState.WAITING:
+                logging.info("Waiting for trigger...")
+            elif status == LogicAnalyserState.CAPTURING:
+                logging.info("Capturing...")
 
-        if int(self.drv.STATUS) == LogicAnalyserState.CAPTURING:
-            logging.info("Capturing...")
+            self.drv.STATUS.wait_for(0xFF, LogicAnalyserState.DONE)
 
-        while int(self.drv.STATUS) != LogicAnalyserState.DONE:
-            pass
-
-        self.retrieve_values()
+            self.retrieve_values()
         logging.info("Values captured")
 
     def to_vcd(self, f):
@@ -7,7 +7,7 @@ class PWM(BMIIModule):
         def __init__(self):
             IOModule.__init__(self, "PWM")
 
-            self.cregs += CtrlReg("WIDTH", CtrlRegDir.RDWR)
+            self.cregs += CtrlReg("WIDTH", CtrlRegDir.RDWR, cached=True)
             self.cregs += CtrlReg("COUNTER", CtrlRegDir.RDONLY)
 
             self.sync += self.cregs.COUNTER.eq(self.cregs.COUNTER + 1)
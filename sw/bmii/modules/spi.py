@@ -8,7 +8,7 @@ class SPIIOModule(IOModule):
         self.cpol = cpol
         self.cpha = cpha
  
-        self.cregs += CtrlReg("SS", CtrlRegDir.RDWR)
+        self.cregs += CtrlReg("SS", CtrlRegDir.RDWR, cached=True)
         self.cregs += CtrlReg("TX", CtrlRegDir.WRONLY)
         self.cregs += CtrlReg("RX", CtrlRegDir.RDONLY)
         self.cregs += CtrlReg("STATUS", CtrlRegDir.RDONLY)
@@ -29,6 +29,10 @@ class SPIIOModule(IOModule):
         fsm = FSM()
         self.submodules += fsm
 
+        # A transfer in progress holds the next TX write and the RX read
+        self.cregs.TX.stall_until(fsm.ongoing("IDLE"))
+        self.cregs.RX.stall_until(fsm.ongoing("IDLE"))
+
         fsm.act("IDLE",
             self.cregs.STATUS.eq(1),
             self.iosignals.SCLK.eq(self.cpol),
@@ -77,7 +81,14 @@ class SPI(BMIIModule):
         return int(self.drv.RX)
 
     def transceive(self, *data):
-        return list([self.transceive_byte(x) for x in data])
+        rx = []
+        with self.drv.batch():
+            for x in data:
+                self.drv.TX = x
+                # RX is only valid once the shift register is back to IDLE
+                self.drv.STATUS.wait_for(0x2, 0x0)
+                rx.append(self.drv.RX.read(1))
+        return [int(x) for x in rx]
 
     @classmethod
     def default(cls, bmii):
@@ -1,5 +1,6 @@
 from bmii import *
 from bmii.modules.spi import SPIDev
+from collections import deque
 from enum import IntEnum
 
 
@@ -22,7 +23,7 @@ class SerialFlash(SPIDev):
     def __init__(self, spi, slave_id):
         SPIDev.__init__(self, spi, slave_id)
 
-        self.spi.iomodule.cregs += CtrlReg("HOLD", CtrlRegDir.RDWR)
+        self.spi.iomodule.cregs += CtrlReg("HOLD", CtrlRegDir.RDWR, cached=True)
         self.spi.iomodule.iosignals += IOSignal("HOLD", IOSignalDir.OUT)
         self.spi.iomodule.comb += \
                 self.spi.iomodule.iosignals.HOLD.eq(~self.spi.iomodule.cregs.HOLD)
@@ -52,13 +53,20 @@ class SerialFlash(SPIDev):
 
     def dump(self, start_addr, size):
         logging.debug("Reading %d bytes at 0x%x ...", size, start_addr)
-        return bytes(self.transceive(*([SFCommand.ReadDataBytes,
-            (start_addr >> 16) & 0xFF,
-            (start_addr >> 8) & 0xFF,
-            start_addr & 0xFF] + [0] * size))[4:])
+        with self.spi.usbctl.drv.operation("SerialFlash.dump"):
+            return bytes(self.transceive(*([SFCommand.ReadDataBytes,
+                (start_addr >> 16) & 0xFF,
+                (start_addr >> 8) & 0xFF,
+                start_addr & 0xFF] + [0] * size))[4:])
 
     def dump_to_file(self, path, bs=4096, nb=512):
-        with open(path, 'wb+') as f:
+        drv = self.spi.usbctl.drv
+        with open(path, 'wb+') as f, drv.operation("SerialFlash.dump_to_file"):
             logging.debug("Dumping flash into %s", path)
+            pending = deque()
             for b in range(nb):
-                f.write(self.dump(b * bs, bs))
+                pending.append(drv.submit(self.dump, b * bs, bs))
+                if len(pending) >= drv.queue_depth:
+                    f.write(pending.popleft().result())
+            while pending:
+                f.write(pending.popleft().result())
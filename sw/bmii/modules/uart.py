@@ -1,4 +1,5 @@
 from bmii import *
+from bmii.ioctl.testbench import *
 from migen.genlib.fifo import *
 from migen.genlib.fsm import *
 
@@ -233,6 +234,10 @@ class UARTIOModule(IOModule):
         self.comb += tx.fifo.we.eq(self.cregs.THR.wr_pulse)
         self.comb += tx.fifo.din.eq(self.cregs.THR)
         self.comb += self.cregs.STATUS[1].eq(tx.fifo.writable)
+        # A full FIFO frees a slot once the current character is out
+        char_bits = 1 + data_width + (1 if parity_bit else 0) + stop_bits
+        self.cregs.THR.stall_until(tx.fifo.writable,
+                (char_bits + 1) * 48000000 // baudrate)
         self.comb += self.iosignals.TX.eq(tx.tx)
 
         # RX
@@ -243,12 +248,56 @@ class UARTIOModule(IOModule):
         self.comb += self.cregs.RHR.eq(rx.fifo.dout)
         self.comb += self.cregs.STATUS[0].eq(rx.fifo.readable)
         self.comb += rx.fifo.re.eq(self.cregs.RHR.rd_pulse)
+        self.cregs.RHR.stall_until(rx.fifo.readable)
+
+
+class LoopbackUARTIOModule(UARTIOModule):
+    def __init__(self):
+        UARTIOModule.__init__(self, 1000000, 8, None, 1)
+        self.comb += self.iosignals.RX.eq(self.iosignals.TX)
+
+
+class UARTTestCase(IOModuleTestCase(LoopbackUARTIOModule())):
+    def run_with(self, generator):
+        # The simulator does not derive the baudrate clocks from sys
+        run_simulation(self.tb, generator,
+                clocks={"sys": 10, "brg_clk": 480, "rx_clk": 120})
+
+    def test_rhr(self):
+        def gen():
+            cregs = self.tb.iomodule.cregs
+            for value in [0x42, 0x13]:
+                yield from self.ibus_write_creg(cregs.THR, value)
+                yield
+                yield
+                yield from self.ibus_reset()
+                yield
+
+            for i in range(1200):
+                yield
+
+            # The FIFO is popped once the host is done sampling RHR
+            for value in [0x42, 0x13]:
+                yield from self.ibus_read_creg(cregs.RHR)
+                for i in range(4):
+                    yield
+                    self.assertEqual((yield self.tb.ibus_m.miso), value)
+                yield from self.ibus_reset()
+                yield
+                yield
+
+            yield from self.ibus_read_creg(cregs.STATUS)
+            yield
+            self.assertEqual((yield self.tb.ibus_m.miso) & 1, 0)
+
+        self.run_with(gen())
 
 
 class UART(BMIIModule):
     def __init__(self, baudrate=115200, data_width=8, parity_bit=None, stop_bits=1):
         BMIIModule.__init__(self,
-                UARTIOModule(baudrate, data_width, parity_bit, stop_bits))
+                UARTIOModule(baudrate, data_width, parity_bit, stop_bits),
+                UARTTestCase)
 
     @classmethod
     def default(cls, bmii):
@@ -261,13 +310,10 @@ class UART(BMIIModule):
         return uart
 
     def transmit_char(self, data):
-        while not int(self.drv.STATUS) >> 1:
-            pass
         self.drv.THR = data
 
     def transmit(self, s):
-        for i in s:
-            self.transmit_char(i)
+        self.drv.THR.write_burst(bytes(s))
 
     def echo(self):
         if int(self.drv.STATUS) & 1:
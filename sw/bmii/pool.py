@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+
+from bmii.bmii import BMII
+from bmii.usbctl.transport import list_devices
+
+
+class BoardResult():
+    def __init__(self, device, value=None, error=None, elapsed=0):
+        self.device = device
+        self.value = value
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        if not self.ok:
+            return "<BoardResult {} failed: {}>".format(self.device, self.error)
+        return "<BoardResult {}: {!r}>".format(self.device, self.value)
+
+
+class BMIIPool():
+    def __init__(self, devices=None, factory=None, transport=None,
+            workers=None, stats=False):
+        if devices is None:
+            devices = [dev["path"] for dev in list_devices()]
+        if not devices:
+            raise IOError("Device not found")
+        if factory is None:
+            factory = BMII.default
+
+        self.boards = {}
+        for device in devices:
+            logging.debug("Adding board %s to pool", device)
+            bmii = factory()
+            if transport is None:
+                bmii.usbctl.set_device(device)
+            else:
+                bmii.usbctl.drv.set_transport(transport(bmii, device))
+            if stats:
+                bmii.usbctl.drv.enable_stats()
+            self.boards[device] = bmii
+
+        # Board work is bound by USB transfers, during which libusb releases
+        # the GIL: threads are enough to keep every board busy
+        self.executor = ThreadPoolExecutor(
+                max_workers=len(self.boards) if workers is None else workers,
+                thread_name_prefix="bmii-pool")
+
+    def run(self, device, func, args, kwargs):
+        bmii = self.boards[device]
+        name = "BMIIPool." + getattr(func, "__name__", "run")
+        start = time.perf_counter()
+        try:
+            with bmii.usbctl.drv.operation(name):
+                value = func(bmii, *args, **kwargs)
+        except Exception as e:
+            logging.error("%s: %s", device, e)
+            return BoardResult(device, error=e,
+                    elapsed=time.perf_counter() - start)
+        return BoardResult(device, value,
+                elapsed=time.perf_counter() - start)
+
+    def map(self, func, *args, **kwargs):
+        futures = [self.executor.submit(self.run, device, func, args, kwargs)
+                for device in self.boards]
+        return [f.result() for f in futures]
+
+    def test(self):
+        return self.map(BMII.test)
+
+    def stats(self):
+        return dict([(device, bmii.usbctl.drv.stats())
+            for device, bmii in self.boards.items()])
+
+    def close(self):
+        self.executor.shutdown()
+        for bmii in self.boards.values():
+            bmii.usbctl.drv.detach()
+
+    def __len__(self):
+        return len(self.boards)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
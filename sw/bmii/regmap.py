@@ -0,0 +1,135 @@
+from enum import Enum
+import json
+import logging
+import os
+
+MANIFEST_VERSION = 1
+
+# A select byte carries the low bits of the module and register addresses,
+# the northbridge PAGE register holds the high bits
+SELECT_MADDR_BITS = 3
+SELECT_RADDR_BITS = 5
+PAGE_MADDR_BITS = 3
+PAGE_RADDR_BITS = 3
+MADDR_WIDTH = SELECT_MADDR_BITS + PAGE_MADDR_BITS
+RADDR_WIDTH = SELECT_RADDR_BITS + PAGE_RADDR_BITS
+# Select byte of northbridge.PAGE: module 0 is the northbridge whatever
+# the page, so that PAGE is always reachable
+PAGE_SELECT = 3 << SELECT_MADDR_BITS
+# PAGE bit arming auto-increment for the next select: every data transfer
+# then moves on to the following register. The northbridge clears it.
+PAGE_AUTOINC = 1 << (PAGE_MADDR_BITS + PAGE_RADDR_BITS)
+PAGE_MASK = PAGE_AUTOINC - 1
+# Longest stall of a data transfer, in 48 MHz cycles, before the
+# northbridge lets it complete anyway, unless a connected register
+# declares a longer one
+STALL_TIMEOUT = 0xFFFF
+
+
+class CtrlRegDir(Enum):
+    RDONLY  = 0
+    WRONLY  = 1
+    RDWR    = 2
+
+
+def paged(maddr):
+    return (maddr & ((1 << SELECT_MADDR_BITS) - 1)) != 0
+
+
+def creg_addr(maddr, raddr):
+    if maddr >= 1 << MADDR_WIDTH or raddr >= 1 << RADDR_WIDTH:
+        raise ValueError("Address {}:{} out of range".format(maddr, raddr))
+    select = ((raddr & ((1 << SELECT_RADDR_BITS) - 1)) << SELECT_MADDR_BITS) \
+            | (maddr & ((1 << SELECT_MADDR_BITS) - 1))
+    page = (maddr >> SELECT_MADDR_BITS) \
+            | ((raddr >> SELECT_RADDR_BITS) << PAGE_MADDR_BITS)
+    return (page << 8) | select
+
+
+def addr_page(addr):
+    if not paged(addr & 0xFF):
+        return None
+    return addr >> 8
+
+
+def page_addr(select, page):
+    if not paged(select) or page is None:
+        return select
+    return (page << 8) | select
+
+
+def creg_size(creg):
+    # Bytes on the bus for one value of a control register
+    return creg.width // 8
+
+
+def default_manifest():
+    return os.environ.get("BMII_MANIFEST", os.path.join("build", "bmii.json"))
+
+
+class RegMapCReg():
+    def __init__(self, iomodule, desc):
+        self.iomodule = iomodule
+        self.name = desc["name"]
+        self.addr = desc["addr"]
+        self.direction = CtrlRegDir[desc["direction"]]
+        self.cached = desc["cached"]
+        self.width = desc.get("width", 8)
+        self.fields = dict([(name, tuple(f))
+            for name, f in desc["fields"].items()])
+
+    def __repr__(self):
+        return "<RegMapCReg " + self.name + "@" + hex(self.addr) + ">"
+
+
+class RegMapModule():
+    def __init__(self, desc):
+        self.name = desc["name"]
+        self.addr = desc["addr"]
+        self.shadowed = desc["shadowed"]
+        self.cregs = dict([(r["name"], RegMapCReg(self, r))
+            for r in desc["cregs"]])
+
+    def __repr__(self):
+        return "<RegMapModule " + self.name + "@" + hex(self.addr) + ">"
+
+
+class RegMap():
+    def __init__(self, manifest):
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise IOError("Unsupported manifest version {}".\
+                    format(manifest.get("version")))
+        self.modules = dict([(m["name"], RegMapModule(m))
+            for m in manifest["modules"]])
+        self.interrupts = [(i["module"], i["name"])
+                for i in manifest["interrupts"]]
+
+    @classmethod
+    def load(cls, path=None):
+        path = default_manifest() if path is None else path
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            raise IOError("Cannot load register manifest {}: {}".\
+                    format(path, e))
+        return cls(manifest)
+
+    @staticmethod
+    def save(manifest, path=None):
+        path = default_manifest() if path is None else path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        logging.info("Register manifest written to %s", path)
+
+    def creg(self, module, name):
+        m = self.modules.get(module)
+        if m is None:
+            return None
+        return m.cregs.get(name)
+
+    def interrupt_name(self, number):
+        if not 0 < number <= len(self.interrupts):
+            return "unknown"
+        return "{}.{}".format(*self.interrupts[number - 1])
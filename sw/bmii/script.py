@@ -0,0 +1,167 @@
+import json
+import sys
+import time
+
+from bmii.usbctl.drv import POLL_MAX_ITERATIONS
+
+# Minimum and maximum number of arguments of each script command, eval
+# takes the rest of the line
+SCRIPT_OPS = {
+    "get": (2, 2),
+    "set": (3, 3),
+    "wait": (4, 5),
+    "sleep": (1, 1),
+    "eval": None,
+}
+
+
+def auto_int(nb):
+    return int(nb, 0)
+
+
+class ScriptCommand():
+    def __init__(self, lineno, text, op, args):
+        self.lineno = lineno
+        self.text = text
+        self.op = op
+        self.args = args
+        self.creg = None
+        self.result = None
+
+    def report(self):
+        res = {"line": self.lineno, "cmd": self.text}
+        if self.op in ["get", "wait"]:
+            res["value"] = int(self.result)
+        elif self.op == "eval":
+            res["value"] = repr(self.result)
+        return res
+
+
+class Script():
+    def __init__(self, cmds):
+        self.cmds = cmds
+
+    @classmethod
+    def parse(cls, f):
+        cmds = []
+        for lineno, line in enumerate(f, 1):
+            text = line.strip()
+            if not text or text.startswith("#"):
+                continue
+
+            op, _, rest = text.partition(" ")
+            if op not in SCRIPT_OPS:
+                raise IOError("line {}: unknown command {}".format(lineno, op))
+            if SCRIPT_OPS[op] is None:
+                args = [rest.strip()]
+            else:
+                args = rest.split()
+                nmin, nmax = SCRIPT_OPS[op]
+                if not nmin <= len(args) <= nmax:
+                    raise IOError("line {}: wrong number of arguments for {}".\
+                            format(lineno, op))
+            try:
+                if op == "set":
+                    args[2] = auto_int(args[2])
+                elif op == "wait":
+                    args[2:] = [auto_int(a) for a in args[2:]]
+                    if len(args) == 4:
+                        args.append(POLL_MAX_ITERATIONS)
+                elif op == "sleep":
+                    args[0] = auto_int(args[0])
+            except ValueError as e:
+                raise IOError("line {}: {}".format(lineno, e))
+            cmds.append(ScriptCommand(lineno, text, op, args))
+        return cls(cmds)
+
+    @classmethod
+    def load(cls, args):
+        # Kept on the parsed arguments: stdin cannot be read twice if the
+        # CLI falls back from the manifest-only path
+        if getattr(args, "script", None) is None:
+            if args.file == "-":
+                args.script = cls.parse(sys.stdin)
+            else:
+                with open(args.file) as f:
+                    args.script = cls.parse(f)
+        return args.script
+
+    def needs_eval(self):
+        return any(c.op == "eval" for c in self.cmds)
+
+    def resolve(self, lookup):
+        for c in self.cmds:
+            if c.op in ["get", "set", "wait"]:
+                c.creg = lookup(c.args[0], c.args[1])
+                if c.creg is None:
+                    raise IOError("line {}: unknown control register {}.{}".\
+                            format(c.lineno, c.args[0], c.args[1]))
+
+    def groups(self, pipeline=True):
+        group = []
+        for c in self.cmds:
+            if c.op == "eval" or not pipeline:
+                if group:
+                    yield group
+                    group = []
+                yield [c]
+                continue
+            group.append(c)
+            # A failed wait must stop the script before what follows it
+            if c.op == "wait":
+                yield group
+                group = []
+        if group:
+            yield group
+
+    def execute(self, drv, c, env):
+        if c.op == "get":
+            drv.select_creg(c.creg)
+            c.result = drv.read(1)
+        elif c.op == "set":
+            drv.select_creg(c.creg)
+            drv.write(c.args[2])
+        elif c.op == "wait":
+            c.result = drv.poll(c.creg, *c.args[2:])
+        elif c.op == "sleep":
+            if drv.cmds is not None:
+                drv.cmds.delay(c.args[0])
+            else:
+                time.sleep(c.args[0] / 1000)
+        elif c.op == "eval":
+            c.result = eval(c.args[0], env)
+
+    def run(self, drv, env=None, pipeline=True, out=sys.stdout):
+        def emit(res):
+            out.write(json.dumps(res) + "\n")
+            out.flush()
+
+        for n, group in enumerate(self.groups(pipeline)):
+            current = group[0]
+            start = time.perf_counter()
+            try:
+                if len(group) > 1:
+                    with drv.batch():
+                        for current in group:
+                            self.execute(drv, current, env)
+                        current = group[0]
+                else:
+                    self.execute(drv, current, env)
+            except Exception as e:
+                emit({"line": current.lineno, "cmd": current.text,
+                    "group": n, "error": str(e)})
+                return False
+            elapsed = round((time.perf_counter() - start) * 1e6, 1)
+
+            for c in group:
+                if c.op == "wait" and not c.result.matched:
+                    emit({"line": c.lineno, "cmd": c.text, "group": n,
+                        "us": elapsed, "value": c.result.value,
+                        "error": "timeout waiting for {:#x} (mask {:#x})".\
+                                format(c.args[3], c.args[2])})
+                    return False
+                res = c.report()
+                res["group"] = n
+                res["us"] = elapsed
+                emit(res)
+        return True
@@ -0,0 +1,50 @@
+import unittest
+
+from bmii.ioctl.ioctl import IOCtl
+from bmii.ioctl.iomodule import IOModule, CtrlReg, CtrlRegDir
+from bmii.usbctl.drv import Driver
+from bmii.usbctl.sim import SimTransport
+
+
+class RegsModule(IOModule):
+    def __init__(self, name, nregs):
+        IOModule.__init__(self, name)
+        for i in range(nregs):
+            self.cregs += CtrlReg("R{}".format(i), CtrlRegDir.RDWR)
+
+
+class FieldsModule(IOModule):
+    def __init__(self):
+        IOModule.__init__(self, "fields")
+        self.cregs += CtrlReg("CTRL", CtrlRegDir.RDWR)
+        self.cregs.CTRL[0] = "A"
+        self.cregs.CTRL[1] = "B"
+        self.cregs.CTRL[4:8] = "C"
+        self.cregs += CtrlReg("MODE", CtrlRegDir.WRONLY)
+        self.cregs.MODE[0:2] = "X"
+        self.cregs.MODE[2] = "Y"
+
+
+class SimCase(unittest.TestCase):
+    swint = False
+
+    @classmethod
+    def iomodules(cls):
+        return []
+
+    @classmethod
+    def driver(cls):
+        return Driver()
+
+    @classmethod
+    def setUpClass(cls):
+        cls.ioctl = IOCtl(swint=cls.swint)
+        for iomodule in cls.iomodules():
+            cls.ioctl += iomodule
+        cls.drv = cls.driver()
+        cls.drv.set_transport(SimTransport(cls.ioctl))
+        cls.drv.attach()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.drv.detach()
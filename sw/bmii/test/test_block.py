@@ -0,0 +1,30 @@
+from bmii.test.simcase import SimCase, RegsModule
+
+
+class BlockCase(SimCase):
+    @classmethod
+    def iomodules(cls):
+        cls.mod = RegsModule("block", 40)
+        return [cls.mod]
+
+    def test_write_block(self):
+        cregs = self.mod.cregs
+        # Crosses the register page boundary
+        self.drv.write_block(cregs.R29, [0x40 + i for i in range(6)])
+        for i in range(6):
+            self.drv.select_creg(getattr(cregs, "R{}".format(29 + i)))
+            self.assertEqual(self.drv.read(1), 0x40 + i)
+        self.assertEqual(self.drv.read_block(cregs.R29, 6),
+                bytes([0x40 + i for i in range(6)]))
+
+    def test_batch(self):
+        cregs = self.mod.cregs
+        nb = self.ioctl.nb.cregs
+        with self.drv.batch():
+            self.drv.write_block(cregs.R2, b"\x11\x22\x33")
+            self.drv.select_creg(nb.SCRATCH)
+            self.drv.write(0x44)
+            result = self.drv.read_block(cregs.R1, 4)
+            scratch = self.drv.read_block(nb.IDCODE, 2)
+        self.assertEqual(result.value[1:], b"\x11\x22\x33")
+        self.assertEqual(scratch.value, b"\xa5\x44")
@@ -0,0 +1,54 @@
+import os
+import tempfile
+import unittest
+from migen import *
+
+from bmii.ioctl.ioctl import logic_elements
+from bmii.ioctl.iomodule import IOModule, CtrlReg, CtrlRegDir
+from bmii.ioctl.testbench import IOModuleTestCase
+
+
+class PulseModule(IOModule):
+    def __init__(self):
+        IOModule.__init__(self, "pulse")
+        self.cregs += CtrlReg("A", CtrlRegDir.RDWR)
+        self.cregs += CtrlReg("B", CtrlRegDir.RDWR)
+        self.wr_count = Signal(8)
+        self.rd_count = Signal(8)
+        self.sync += If(self.cregs.B.wr_pulse,
+                self.wr_count.eq(self.wr_count + 1))
+        self.sync += If(self.cregs.B.rd_pulse,
+                self.rd_count.eq(self.rd_count + 1))
+
+
+class CtrlRegsCase(IOModuleTestCase(PulseModule())):
+    def test_pulses(self):
+        def gen():
+            cregs = self.tb.iomodule.cregs
+            for creg in [cregs.A, cregs.B, cregs.B, cregs.A]:
+                yield from self.ibus_write_creg(creg, 0x10 + creg.addr)
+                yield
+                yield
+                yield
+                yield from self.ibus_read_creg(creg)
+                yield
+                yield
+                yield from self.ibus_reset()
+                yield
+                yield
+            self.assertEqual((yield cregs.A), 0x10)
+            self.assertEqual((yield cregs.B), 0x11)
+            self.assertEqual((yield self.tb.iomodule.wr_count), 2)
+            self.assertEqual((yield self.tb.iomodule.rd_count), 2)
+
+        self.run_with(gen())
+
+
+class LogicElementsCase(unittest.TestCase):
+    def test_fit_summary(self):
+        with tempfile.TemporaryDirectory() as d:
+            self.assertIsNone(logic_elements(d))
+            with open(os.path.join(d, "top.fit.summary"), "w") as f:
+                f.write("Family : MAX V\n")
+                f.write("Total logic elements : 412 / 570 ( 72 % )\n")
+            self.assertEqual(logic_elements(d), (412, 570))
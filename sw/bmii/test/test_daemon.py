@@ -0,0 +1,92 @@
+import os
+import tempfile
+import threading
+
+from bmii.bmii import BMIIModule, BMIIModules
+from bmii.test.simcase import SimCase, FieldsModule
+from bmii.usbctl.daemon import Daemon, DaemonTransport
+from bmii.usbctl.usbctl import USBCtl
+
+
+class DaemonCase(SimCase):
+    @classmethod
+    def iomodules(cls):
+        cls.fields = FieldsModule()
+        return [cls.fields]
+
+    @classmethod
+    def setUpClass(cls):
+        super(DaemonCase, cls).setUpClass()
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        path = os.path.join(cls.tmpdir.name, "bmii.sock")
+        cls.daemon = Daemon(cls.drv, path)
+        cls.thread = threading.Thread(target=cls.daemon.serve_forever,
+                daemon=True)
+        cls.thread.start()
+        while not DaemonTransport.available(path):
+            pass
+        cls.usbctls = [USBCtl() for i in range(2)]
+        cls.modules = []
+        for usbctl in cls.usbctls:
+            usbctl.drv.set_transport(DaemonTransport(path))
+            modules = BMIIModules(usbctl)
+            modules += BMIIModule(cls.fields)
+            cls.modules.append(modules)
+        cls.drvs = [usbctl.drv for usbctl in cls.usbctls]
+
+    @classmethod
+    def tearDownClass(cls):
+        for drv in cls.drvs:
+            drv.detach()
+        cls.daemon.shutdown()
+        cls.thread.join()
+        super(DaemonCase, cls).tearDownClass()
+        cls.tmpdir.cleanup()
+
+    def test_clients(self):
+        cregs = self.ioctl.nb.cregs
+        a, b = self.drvs
+        a.select_creg(cregs.SCRATCH)
+        b.select_creg(cregs.IDCODE)
+        a.write(0x5A)
+        self.assertEqual(b.read(1), 0xA5)
+        self.assertEqual(a.read(1), 0x5A)
+
+    def test_batch(self):
+        cregs = self.ioctl.nb.cregs
+        a, b = self.drvs
+        with a.batch():
+            a.write_burst(cregs.SCRATCH, b"\x01\x02\x03")
+            result = a.read_many([cregs.IDCODE, cregs.SCRATCH])
+        self.assertEqual(list(result.data), [0xA5, 0x03])
+        self.assertTrue(a.poll(cregs.SCRATCH, 0xFF, 0x03).matched)
+
+    def test_block(self):
+        cregs = self.ioctl.nb.cregs
+        a, b = self.drvs
+        a.select_creg(cregs.SCRATCH)
+        a.write(0x33)
+        self.assertEqual(a.read(1), 0x33)
+        self.assertEqual(list(b.read_block(cregs.IDCODE, 2)), [0xA5, 0x33])
+        # The daemon reselects after the northbridge address moved
+        self.assertEqual(a.read(1), 0x33)
+
+    def test_shadow(self):
+        reg = self.ioctl.sb.cregs.PINDIR1L
+        a, b = self.drvs
+        a.select_creg(reg)
+        a.write(0x0F)
+        self.assertEqual(a.read(1), 0x0F)
+        b.select_creg(reg)
+        b.write(0xF0)
+        self.assertEqual(a.shadow_value(reg), 0xF0)
+        a.select_creg(reg)
+        self.assertEqual(a.read(1), 0xF0)
+
+    def test_wronly_fields(self):
+        a, b = [m.fields.drv for m in self.modules]
+        a.MODE.X = 2
+        b.MODE.Y = 1
+        a.MODE.update(X=1)
+        self.assertEqual(self.drvs[1].shadow_value(self.fields.cregs.MODE),
+                0x05)
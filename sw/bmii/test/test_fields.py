@@ -0,0 +1,57 @@
+from bmii.bmii import BMIIModule, BMIIModules
+from bmii.test.simcase import SimCase, FieldsModule
+from bmii.usbctl.usbctl import USBCtl
+
+
+class FieldsCase(SimCase):
+    @classmethod
+    def iomodules(cls):
+        cls.module = BMIIModule(FieldsModule())
+        return [cls.module.iomodule]
+
+    @classmethod
+    def driver(cls):
+        cls.usbctl = USBCtl()
+        return cls.usbctl.drv
+
+    @classmethod
+    def setUpClass(cls):
+        super(FieldsCase, cls).setUpClass()
+        cls.modules = BMIIModules(cls.usbctl)
+        cls.modules += cls.module
+
+    def test_update(self):
+        ctrl = self.module.drv.CTRL
+        ctrl.write(0x00)
+        ctrl.update(B=0, A=0xFF)
+        self.assertEqual(ctrl.read(1), 0x01)
+        ctrl.update(C=0x1A, B=1)
+        self.assertEqual(ctrl.read(1), 0xA3)
+        ctrl.invalidate()
+        ctrl.update(A=0)
+        self.assertEqual(ctrl.read(1), 0xA2)
+
+    def test_fields(self):
+        ctrl = self.module.drv.CTRL
+        ctrl.write(0x51)
+        self.assertEqual(ctrl.fields(), {"A": 1, "B": 0, "C": 5})
+        ctrl.B = 1
+        self.assertEqual(ctrl.A, 1)
+        self.assertEqual(ctrl.fields(), {"A": 1, "B": 1, "C": 5})
+
+    def test_batch(self):
+        drv = self.module.drv
+        with self.drv.batch():
+            drv.MODE.update(X=2)
+            drv.MODE.update(Y=1)
+            with self.assertRaises(IOError):
+                drv.CTRL.update(A=1)
+            with self.assertRaises(IOError):
+                drv.CTRL.fields()
+            with self.assertRaises(IOError):
+                drv.snapshot()
+        self.assertEqual(self.drv.shadow_value(drv.MODE.creg), 0x06)
+
+    def test_snapshot(self):
+        self.module.drv.CTRL.write(0x5A)
+        self.assertEqual(self.module.drv.snapshot(), {"CTRL": 0x5A})
@@ -0,0 +1,41 @@
+from migen import *
+
+from bmii.ioctl.iomodule import IOModule, CtrlReg, CtrlRegDir
+from bmii.test.simcase import SimCase
+
+
+class SlowModule(IOModule):
+    def __init__(self, latency):
+        IOModule.__init__(self, "slow")
+        self.cregs += CtrlReg("DATA", CtrlRegDir.WRONLY)
+        self.cregs += CtrlReg("SUM", CtrlRegDir.RDONLY)
+        self.cregs += CtrlReg("DONE", CtrlRegDir.RDONLY)
+
+        # Each write keeps the module busy for a while, like a serial
+        # transfer would
+        busy = Signal(max=latency + 1)
+        self.sync += If(self.cregs.DATA.wr_pulse,
+                busy.eq(latency)).\
+            Elif(busy == 1,
+                busy.eq(0),
+                self.cregs.SUM.eq(self.cregs.SUM + self.cregs.DATA),
+                self.cregs.DONE.eq(self.cregs.DONE + 1)).\
+            Elif(busy != 0,
+                busy.eq(busy - 1))
+        self.cregs.DATA.stall_until(busy == 0)
+        self.cregs.SUM.stall_until(busy == 0)
+
+
+class FlowControlCase(SimCase):
+    @classmethod
+    def iomodules(cls):
+        cls.mod = SlowModule(20)
+        return [cls.mod]
+
+    def test_stream(self):
+        cregs = self.mod.cregs
+        self.drv.write_burst(cregs.DATA, b"\x01\x02\x03\x04")
+        # Waits for the last write to be processed
+        self.assertEqual(self.drv.read_burst(cregs.SUM, 1), b"\x0a")
+        self.drv.select_creg(cregs.DONE)
+        self.assertEqual(self.drv.read(1), 4)
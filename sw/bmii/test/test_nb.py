@@ -21,7 +21,16 @@ class NorthBridgeUSBCTLCase(SimCase, unittest.TestCase):
 
             self.miso = Signal(8)
 
-            self.submodules.dut = NorthBridge("northbridge")
+            self.stall_timeout = 8
+            self.submodules.dut = NorthBridge("northbridge",
+                    self.stall_timeout)
+
+            # A slower client raises the northbridge timeout
+            self.max_stall = 16
+            slow = IOModule("slow")
+            slow.cregs += CtrlReg("DATA", CtrlRegDir.RDWR)
+            slow.cregs.DATA.stall_until(Signal(), self.max_stall)
+            self.dut.connect(slow)
 
             self.comb += self.fd_in.eq(self.dut.fdt.o)
             self.comb += self.dut.fdt.i.eq(self.fd_out)
@@ -74,6 +83,49 @@ class NorthBridgeUSBCTLCase(SimCase, unittest.TestCase):
 
         self.run_with(gen())
 
+    def test_ack_keeps_address(self):
+        def gen():
+            yield self.tb.fd_out.eq((8 << 3) | 2)
+            yield self.tb.wr.eq(1)
+            yield self.tb.la.eq(1)
+            yield self.tb.act.eq(1)
+            yield
+
+            # Interrupt acknowledge: address latch read
+            yield self.tb.act.eq(0)
+            yield self.tb.wr.eq(0)
+            yield self.tb.fd_out.eq(0)
+            yield
+            yield self.tb.act.eq(1)
+            yield
+            yield self.tb.act.eq(0)
+            yield
+            self.assertEqual((yield self.tb.dut.ibus_m.maddr), 2)
+            self.assertEqual((yield self.tb.dut.ibus_m.raddr), 8)
+
+        self.run_with(gen())
+
+    def test_stall_timeout(self):
+        def gen():
+            yield self.tb.dut.ibus_m.stall.eq(1)
+            yield
+            self.assertEqual((yield self.tb.iomodule_rdy), 0)
+
+            yield self.tb.act.eq(1)
+            for i in range(self.tb.stall_timeout + 1):
+                yield
+            self.assertEqual((yield self.tb.iomodule_rdy), 0)
+            for i in range(self.tb.max_stall - self.tb.stall_timeout):
+                yield
+            self.assertEqual((yield self.tb.iomodule_rdy), 1)
+
+            yield self.tb.act.eq(0)
+            yield
+            yield
+            self.assertEqual((yield self.tb.iomodule_rdy), 0)
+
+        self.run_with(gen())
+
     def test_write(self):
         def gen():
             value = 42
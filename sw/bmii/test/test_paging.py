@@ -0,0 +1,30 @@
+from bmii.regmap import creg_addr, addr_page, PAGE_SELECT
+from bmii.test.simcase import SimCase, RegsModule
+
+
+class PagingCase(SimCase):
+    @classmethod
+    def iomodules(cls):
+        cls.mods = [RegsModule("m{}".format(i), 1) for i in range(7)]
+        cls.mods.append(RegsModule("wide", 34))
+        return cls.mods
+
+    def test_layout(self):
+        self.assertEqual([m.addr for m in self.mods],
+                [2, 3, 4, 5, 6, 7, 9, 10])
+        self.assertEqual(creg_addr(2, 3), 3 << 3 | 2)
+        self.assertEqual(addr_page(creg_addr(9, 33)), 1 << 3 | 1)
+        self.assertIsNone(addr_page(PAGE_SELECT))
+
+    def test_access(self):
+        wide = self.mods[-1].cregs
+        cregs = [self.mods[5].cregs.R0, self.mods[6].cregs.R0, wide.R1,
+                wide.R33, self.ioctl.nb.cregs.SCRATCH]
+        for i, creg in enumerate(cregs):
+            self.drv.select_creg(creg)
+            self.drv.write(0x10 + i)
+        for i, creg in enumerate(cregs):
+            self.drv.select_creg(creg)
+            self.assertEqual(self.drv.read(1), 0x10 + i)
+        self.assertEqual(self.drv.read_many(cregs + [wide.R1]),
+                [0x10, 0x11, 0x12, 0x13, 0x14, 0x12])
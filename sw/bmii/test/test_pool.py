@@ -0,0 +1,36 @@
+import unittest
+
+from bmii.bmii import BMII
+from bmii.pool import BMIIPool
+from bmii.usbctl.sim import SimTransport
+
+
+def scratch(bmii, value):
+    nb = bmii.modules.northbridge.drv
+    nb.SCRATCH = value
+    return int(nb.SCRATCH)
+
+
+def fail(bmii):
+    raise IOError("board failure")
+
+
+class BMIIPoolCase(unittest.TestCase):
+    def test_map(self):
+        with BMIIPool(["sim0", "sim1"], factory=BMII,
+                transport=lambda bmii, device: SimTransport(bmii.ioctl),
+                stats=True) as pool:
+            self.assertEqual(len(pool), 2)
+            res = pool.map(scratch, 3)
+            self.assertEqual([r.device for r in res], ["sim0", "sim1"])
+            self.assertEqual([r.value for r in res], [3, 3])
+            self.assertTrue(all(r.ok for r in res))
+
+            res = pool.map(fail)
+            self.assertFalse(any(r.ok for r in res))
+
+            stats = pool.stats()
+            for device in ["sim0", "sim1"]:
+                ops = dict([(op["name"], op)
+                    for op in stats[device]["operations"]])
+                self.assertEqual(ops["BMIIPool.scratch"]["calls"], 1)
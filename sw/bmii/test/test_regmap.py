@@ -0,0 +1,33 @@
+import unittest
+
+from bmii.ioctl.ioctl import IOCtl
+from bmii.regmap import RegMap, CtrlRegDir
+from bmii.usbctl.drv import Driver
+
+
+class RegMapCase(unittest.TestCase):
+    def test_manifest(self):
+        ioctl = IOCtl(swint=True)
+        regmap = RegMap(ioctl.manifest())
+        drv = Driver()
+
+        for iomodule in [ioctl.nb, ioctl.sb]:
+            for creg in iomodule.cregs.__dict__.values():
+                if not hasattr(creg, "direction"):
+                    continue
+                r = regmap.creg(iomodule.name, creg.name)
+                self.assertEqual(drv.creg_addr(r), drv.creg_addr(creg))
+                self.assertEqual(r.direction, creg.direction)
+                self.assertEqual(r.cached, creg.cached)
+
+        self.assertEqual(regmap.creg("southbridge", "PINDIR1L").fields["IO12"],
+                (2, 1))
+        self.assertIs(regmap.creg("northbridge", "EOI").direction,
+                CtrlRegDir.WRONLY)
+        self.assertEqual(regmap.interrupt_name(1), "northbridge.SWINT")
+        self.assertIsNone(regmap.creg("northbridge", "NOPE"))
+
+    def test_no_swint(self):
+        regmap = RegMap(IOCtl().manifest())
+        self.assertIsNone(regmap.creg("northbridge", "SWINT"))
+        self.assertEqual(regmap.creg("northbridge", "PAGE").addr, 3)
@@ -0,0 +1,40 @@
+import io
+import json
+
+from bmii.script import Script
+from bmii.test.simcase import SimCase
+
+SCRIPT = """
+# comment
+set northbridge SCRATCH 0x5A
+get northbridge SCRATCH
+wait northbridge SCRATCH 0xF0 0x50
+eval 1 + 1
+get northbridge IDCODE
+"""
+
+
+class ScriptCase(SimCase):
+    def setUp(self):
+        self.script = Script.parse(io.StringIO(SCRIPT))
+        self.script.resolve(lambda m, r: getattr(self.ioctl.nb.cregs, r)
+                if m == "northbridge" else None)
+
+    def test_parse(self):
+        self.assertEqual([[c.lineno for c in g] for g in self.script.groups()],
+                [[3, 4, 5], [6], [7]])
+        self.assertEqual(len(list(self.script.groups(False))), 5)
+        self.assertTrue(self.script.needs_eval())
+        with self.assertRaises(IOError):
+            Script.parse(io.StringIO("set northbridge SCRATCH"))
+        with self.assertRaises(IOError):
+            Script.parse(io.StringIO("get southbridge")).resolve(
+                    lambda m, r: None)
+
+    def test_run(self):
+        out = io.StringIO()
+        self.assertTrue(self.script.run(self.drv, {}, out=out))
+        res = [json.loads(l) for l in out.getvalue().splitlines()]
+        self.assertEqual([r.get("value") for r in res],
+                [None, 0x5A, 0x5A, "2", 0xA5])
+        self.assertEqual([r["group"] for r in res], [0, 0, 0, 1, 2])
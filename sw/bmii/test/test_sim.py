@@ -0,0 +1,68 @@
+from bmii.test.simcase import SimCase
+
+
+class SimTransportCase(SimCase):
+    swint = True
+
+    def test_scratch(self):
+        scratch = self.ioctl.nb.cregs.SCRATCH
+        for value in [0x00, 0x2A, 0xFF]:
+            self.drv.select_creg(scratch)
+            self.drv.write(value)
+            self.assertEqual(self.drv.read(1), value)
+
+    def test_batch(self):
+        cregs = self.ioctl.nb.cregs
+        with self.drv.batch():
+            self.drv.write_burst(cregs.SCRATCH, b"\x12\x34")
+            result = self.drv.read_burst(cregs.SCRATCH, 2)
+        self.assertEqual(result.value, b"\x34\x34")
+        self.assertEqual(self.drv.read_many([cregs.IDCODE, cregs.SCRATCH]),
+                [0xA5, 0x34])
+
+    def test_poll(self):
+        scratch = self.ioctl.nb.cregs.SCRATCH
+        self.drv.select_creg(scratch)
+        self.drv.write(0x81)
+        result = self.drv.poll(scratch, 0x80, 0x80)
+        self.assertTrue(result.matched)
+        self.assertEqual(result.iterations, 1)
+        result = self.drv.poll(scratch, 0xFF, 0x00, 4)
+        self.assertFalse(result.matched)
+        self.assertEqual(result.iterations, 4)
+
+    def test_swint(self):
+        cregs = self.ioctl.nb.cregs
+        self.drv.select_creg(cregs.SWINT)
+        self.drv.write(1)
+        self.assertEqual(self.drv.get_events(), [1])
+        self.drv.select_creg(cregs.EOI)
+        self.drv.write(1)
+        self.assertEqual(self.drv.get_events(), [])
+
+    def test_shadow(self):
+        reg = self.ioctl.sb.cregs.PINOUTMISC
+        self.drv.select_creg(reg)
+        self.drv.write(0x02)
+        self.drv.enable_stats()
+        try:
+            self.assertEqual(self.drv.read(1), 0x02)
+            self.assertEqual(self.drv.stats()["totals"]["count"], 0)
+            self.drv.invalidate_shadow(reg)
+            self.assertEqual(self.drv.read(1), 0x02)
+            self.assertEqual(self.drv.stats()["totals"]["count"], 2)
+        finally:
+            self.drv.enable_stats(False)
+
+    def test_operation(self):
+        scratch = self.ioctl.nb.cregs.SCRATCH
+        self.drv.enable_stats()
+        try:
+            with self.drv.operation("submit"):
+                self.drv.submit(self.drv.read_burst, scratch, 2).result()
+            op = self.drv.stats()["operations"][0]
+            self.assertEqual(op["name"], "submit")
+            self.assertGreater(op["transfers"], 0)
+            self.assertEqual(op["bytes"], 2)
+        finally:
+            self.drv.enable_stats(False)
@@ -0,0 +1,77 @@
+from migen import *
+
+from bmii.ioctl.iomodule import IOModule, CtrlReg, CtrlRegDir
+from bmii.regmap import RegMap
+from bmii.test.simcase import SimCase
+
+
+class WideModule(IOModule):
+    def __init__(self):
+        IOModule.__init__(self, "wide")
+        self.cregs += CtrlReg("VALUE", CtrlRegDir.RDWR, width=32)
+        self.cregs += CtrlReg("COUNTER", CtrlRegDir.RDONLY, width=16)
+        self.cregs += CtrlReg("COMMITS", CtrlRegDir.RDONLY)
+        self.cregs += CtrlReg("SHADOW", CtrlRegDir.WRONLY, width=16)
+
+        # Both bytes always hold the same count: a torn read would not
+        counter = Signal(8)
+        self.sync += counter.eq(counter + 1)
+        self.comb += self.cregs.COUNTER.eq(Cat(counter, counter))
+        self.sync += If(self.cregs.VALUE.wr_pulse,
+                self.cregs.COMMITS.eq(self.cregs.COMMITS + 1))
+
+
+class WideCase(SimCase):
+    @classmethod
+    def iomodules(cls):
+        cls.mod = WideModule()
+        return [cls.mod]
+
+    def test_value(self):
+        cregs = self.mod.cregs
+        self.drv.select_creg(cregs.COMMITS)
+        commits = self.drv.read(1)
+        self.drv.select_creg(cregs.VALUE)
+        self.drv.write(0x12345678)
+        self.assertEqual(self.drv.read(1), 0x12345678)
+        self.drv.select_creg(cregs.COMMITS)
+        self.assertEqual(self.drv.read(1), commits + 1)
+
+    def test_snapshot(self):
+        cregs = self.mod.cregs
+        for i in range(4):
+            self.drv.select_creg(cregs.COUNTER)
+            value = self.drv.read(1)
+            self.assertEqual(value >> 8, value & 0xFF)
+        with self.drv.batch():
+            self.drv.select_creg(cregs.VALUE)
+            self.drv.write(0xCAFE0001)
+            result = self.drv.read_many([cregs.VALUE, cregs.COUNTER])
+        self.assertEqual(result[0].value, 0xCAFE0001)
+
+    def test_shadow(self):
+        cregs = self.mod.cregs
+        self.drv.select_creg(cregs.SHADOW)
+        self.drv.write(0xBEEF)
+        self.assertEqual(self.drv.shadow_value(cregs.SHADOW), 0xBEEF)
+        with self.assertRaises(ValueError):
+            self.drv.poll(cregs.COUNTER, 0xFF, 0)
+
+    def test_block(self):
+        cregs = self.mod.cregs
+        with self.assertRaises(ValueError):
+            self.drv.write_block(cregs.VALUE, b"\x01\x02\x03\x04")
+        with self.assertRaises(ValueError):
+            self.drv.read_block(cregs.COUNTER, 2)
+        regmap = RegMap(self.ioctl.manifest())
+        with self.assertRaises(ValueError):
+            self.drv.read_block(regmap.creg("wide", "VALUE"), 3)
+        self.drv.select_creg(cregs.COMMITS)
+        commits = self.drv.read(1)
+        self.assertEqual(bytes(self.drv.read_block(cregs.COMMITS, 1)),
+                bytes([commits]))
+
+    def test_manifest(self):
+        regmap = RegMap(self.ioctl.manifest())
+        self.assertEqual(regmap.creg("wide", "VALUE").width, 32)
+        self.assertEqual(regmap.creg("wide", "COMMITS").width, 8)
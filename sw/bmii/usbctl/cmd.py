@@ -0,0 +1,211 @@
+from enum import IntEnum
+
+from bmii.regmap import PAGE_SELECT, PAGE_AUTOINC, PAGE_MASK
+
+
+class Opcode(IntEnum):
+    SELECT  = 0x01
+    WRITE   = 0x02
+    READ    = 0x03
+    DELAY   = 0x04
+    POLL    = 0x05
+    GATHER  = 0x06
+
+
+CMD_MAX_COUNT = 0xFF
+
+
+def scan(pkt):
+    res_size = 0
+    selected = None
+    page = None
+    armed = False
+    autoinc = False
+    i = 0
+    while i < len(pkt):
+        op = pkt[i]
+        i += 1
+        if op == Opcode.SELECT:
+            selected = pkt[i]
+            autoinc, armed = armed, False
+            i += 1
+        elif op == Opcode.WRITE:
+            if selected == PAGE_SELECT and not autoinc and pkt[i]:
+                page = pkt[i + pkt[i]] & PAGE_MASK
+                armed = bool(pkt[i + pkt[i]] & PAGE_AUTOINC)
+            i += 1 + pkt[i]
+        elif op == Opcode.READ:
+            res_size += pkt[i]
+            i += 1
+        elif op == Opcode.DELAY:
+            i += 1
+        elif op == Opcode.POLL:
+            res_size += 3
+            i += 4
+        elif op == Opcode.GATHER:
+            n = pkt[i]
+            if n:
+                selected = pkt[i + n]
+                autoinc, armed = armed, False
+            res_size += n
+            i += 1 + n
+        else:
+            break
+    return res_size, selected, page, autoinc or armed
+
+
+class BatchResult():
+    def __init__(self, size):
+        self.size = size
+        self.data = bytearray(size)
+        self.done = False
+
+    def check(self):
+        if not self.done:
+            raise IOError("Batch result read before flush")
+
+    @property
+    def value(self):
+        self.check()
+        if self.size == 1:
+            return self.data[0]
+        return bytes(self.data)
+
+    def __int__(self):
+        return int(self.value)
+
+    def __index__(self):
+        return int(self.value)
+
+    def __repr__(self):
+        if not self.done:
+            return "<BatchResult pending>"
+        return "<BatchResult {}>".format(self.value)
+
+
+class ValueResult(BatchResult):
+    # Little-endian value of a control register, whatever its width
+    @property
+    def value(self):
+        self.check()
+        return int.from_bytes(self.data, "little")
+
+
+class PollResult(BatchResult):
+    def __init__(self, mask, expected):
+        BatchResult.__init__(self, 3)
+        self.mask = mask
+        self.expected = expected
+
+    @property
+    def value(self):
+        self.check()
+        return self.data[0]
+
+    @property
+    def iterations(self):
+        self.check()
+        return self.data[1] | (self.data[2] << 8)
+
+    @property
+    def matched(self):
+        return (self.value & self.mask) == self.expected
+
+
+class BatchPacket():
+    def __init__(self):
+        self.cmds = bytearray()
+        self.segments = []
+        self.res_size = 0
+        self.last_write = None
+
+    def add_result(self, result, offset, size):
+        self.segments.append((result, offset, size))
+        self.res_size += size
+
+
+class Batch():
+    def __init__(self, drv):
+        self.drv = drv
+        self.pkt_size = drv.ep_cmd.wMaxPacketSize
+        self.packets = [BatchPacket()]
+
+    def push(self, cmd, reserve=0):
+        pkt = self.packets[-1]
+        if len(pkt.cmds) + len(cmd) + reserve > self.pkt_size:
+            pkt = BatchPacket()
+            self.packets.append(pkt)
+        pkt.last_write = None
+        pkt.cmds += bytes(cmd)
+        return pkt
+
+    def select(self, addr):
+        self.push([Opcode.SELECT, addr])
+
+    def write(self, data):
+        data = memoryview(bytes(data))
+        while len(data):
+            pkt = self.packets[-1]
+            if pkt.last_write is not None:
+                count = pkt.cmds[pkt.last_write]
+                n = min(CMD_MAX_COUNT - count, self.pkt_size - len(pkt.cmds),
+                        len(data))
+                if n:
+                    pkt.cmds[pkt.last_write] = count + n
+                    pkt.cmds += data[:n]
+                    data = data[n:]
+                    continue
+
+            pkt = self.push([Opcode.WRITE, 0], reserve=1)
+            pkt.last_write = len(pkt.cmds) - 1
+
+    def read(self, size, result=None):
+        if result is None:
+            result = BatchResult(size)
+        for offset in range(0, size, CMD_MAX_COUNT):
+            n = min(CMD_MAX_COUNT, size - offset)
+            pkt = self.push([Opcode.READ, n])
+            pkt.add_result(result, offset, n)
+        return result
+
+    def gather(self, addrs, result=None, start=0):
+        if result is None:
+            result = BatchResult(len(addrs))
+        offset = 0
+        while offset < len(addrs):
+            n = min(CMD_MAX_COUNT, self.pkt_size - 2, len(addrs) - offset)
+            pkt = self.push([Opcode.GATHER, n] + addrs[offset:offset + n])
+            pkt.add_result(result, start + offset, n)
+            offset += n
+        return result
+
+    def delay(self, ms):
+        while ms > 0:
+            n = min(CMD_MAX_COUNT, ms)
+            self.push([Opcode.DELAY, n])
+            ms -= n
+
+    def poll(self, mask, value, timeout=0xFFFF):
+        result = PollResult(mask, value)
+        pkt = self.push([Opcode.POLL, mask, value,
+            timeout & 0xFF, (timeout >> 8) & 0xFF])
+        pkt.add_result(result, 0, result.size)
+        return result
+
+    def flush(self):
+        for pkt in self.packets:
+            if not pkt.cmds:
+                continue
+            self.drv.ep_cmd.write(pkt.cmds)
+            if not pkt.res_size:
+                continue
+            res = self.drv.ep_res.read(pkt.res_size)
+            if len(res) != pkt.res_size:
+                raise IOError("Short batch response: expected {}, got {}".\
+                        format(pkt.res_size, len(res)))
+            pos = 0
+            for result, offset, size in pkt.segments:
+                result.data[offset:offset + size] = res[pos:pos + size]
+                result.done = result.done or offset + size == result.size
+                pos += size
+        self.packets = [BatchPacket()]
@@ -0,0 +1,372 @@
+from array import array
+import atexit
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import usb
+
+from bmii.regmap import PAGE_SELECT, PAGE_AUTOINC, PAGE_MASK, page_addr
+from bmii.usbctl.cmd import scan
+from bmii.usbctl.drv import bmRequestType, bRequest as Request, Endpoint
+from bmii.usbctl.transport import Transport
+
+PKT_SIZE = 512
+EVENT_PKT_SIZE = 64
+
+
+def default_socket():
+    path = os.environ.get("BMII_SOCKET")
+    if path:
+        return path
+    return os.path.join(os.environ.get("XDG_RUNTIME_DIR", "/tmp"),
+            "bmii-{}.sock".format(os.getuid()))
+
+
+def encode(data):
+    if data is None or isinstance(data, (int, tuple)):
+        return data
+    return bytes(data).hex()
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        daemon = self.server.bmii_daemon
+        for line in self.rfile:
+            req = json.loads(line.decode())
+            try:
+                res = {"data": encode(daemon.dispatch(req))}
+            except usb.core.USBError as e:
+                res = {"error": str(e), "errno": e.errno}
+            except Exception as e:
+                logging.debug("Request %s failed: %s", req.get("op"), e)
+                res = {"error": str(e)}
+            try:
+                self.wfile.write((json.dumps(res) + "\n").encode())
+                self.wfile.flush()
+            except BrokenPipeError:
+                return
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Daemon():
+    def __init__(self, drv, path=None):
+        self.drv = drv
+        self.path = default_socket() if path is None else path
+        self.server = None
+        self.shadow = {}
+
+    def select(self, req):
+        if req["addr"] is not None:
+            self.drv.select_addr(req["addr"], req.get("autoinc", False))
+
+    def dispatch(self, req):
+        op = req["op"]
+        drv = self.drv
+
+        if op == "events":
+            # The event endpoint is independent from the register path
+            return drv.ep_evt.read(req["size"], req["timeout"])
+        elif op == "shadow":
+            addr = req["addr"]
+            if req.get("clear"):
+                if addr is None:
+                    self.shadow.clear()
+                else:
+                    self.shadow.pop(addr, None)
+            elif "value" in req:
+                self.shadow[addr] = req["value"]
+            return self.shadow.get(addr)
+
+        with drv.lock:
+            drv.attach()
+            if op == "info":
+                return (drv.dev.bus, drv.dev.address)
+            elif op == "write":
+                self.select(req)
+                data = bytes.fromhex(req["data"])
+                drv.write(data)
+                return len(data)
+            elif op == "read":
+                self.select(req)
+                drv.load_rdfifo(req["size"])
+                return drv.ep_rd.read(req["size"])
+            elif op == "poll":
+                self.select(req)
+                return drv.dev.ctrl_transfer(bmRequestType.VENDOR_RD,
+                        Request.POLL_CREG, req["value"], req["index"], 3,
+                        req.get("timeout"))
+            elif op == "cmd":
+                self.select(req)
+                pkt = bytes.fromhex(req["data"])
+                res_size, selected, page, autoinc = scan(pkt)
+                drv.ep_cmd.write(pkt)
+                if page is not None:
+                    drv.page = page
+                if autoinc:
+                    drv.selected = None
+                elif selected is not None:
+                    drv.selected = page_addr(selected, drv.page)
+                if not res_size:
+                    return b""
+                return drv.ep_res.read(res_size)
+            elif op == "ctrl":
+                data = req["data"]
+                if isinstance(data, str):
+                    data = bytes.fromhex(data)
+                res = drv.dev.ctrl_transfer(req["type"], req["request"],
+                        req["value"], req["index"], data)
+                if req["request"] == Request.SET_CPU_SPD:
+                    drv.invalidate()
+                return res
+            else:
+                raise IOError("Unknown daemon request {}".format(op))
+
+    def serve_forever(self):
+        self.drv.attach()
+        if os.path.exists(self.path):
+            if DaemonTransport.available(self.path):
+                raise IOError("A bmii daemon is already listening on {}".\
+                        format(self.path))
+            os.unlink(self.path)
+
+        self.server = DaemonServer(self.path, DaemonHandler)
+        self.server.bmii_daemon = self
+        os.chmod(self.path, 0o600)
+        logging.info("Listening on %s", self.path)
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            os.unlink(self.path)
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+
+
+class DaemonConnection():
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.rfile = self.sock.makefile("rb")
+        self.wfile = self.sock.makefile("wb")
+        self.pending = 0
+
+    def post(self, op, **args):
+        args["op"] = op
+        with self.lock:
+            self.wfile.write((json.dumps(args) + "\n").encode())
+            self.wfile.flush()
+            self.pending += 1
+
+    def sync(self):
+        with self.lock:
+            error = None
+            res = None
+            while self.pending:
+                line = self.rfile.readline()
+                if not line:
+                    self.pending = 0
+                    raise IOError("Connection to the bmii daemon lost")
+                self.pending -= 1
+                res = json.loads(line.decode())
+                if error is None and "error" in res:
+                    error = res
+        if error is not None:
+            if error.get("errno") is not None:
+                raise usb.core.USBError(error["error"], errno=error["errno"])
+            raise IOError(error["error"])
+        return res["data"] if res is not None else None
+
+    def call(self, op, **args):
+        self.post(op, **args)
+        return self.sync()
+
+    def close(self):
+        try:
+            self.sync()
+        except IOError as e:
+            logging.error("%s", e)
+        finally:
+            self.sock.close()
+
+
+def decode(data):
+    return array('B', bytes.fromhex(data))
+
+
+class RemoteEndpoint():
+    def __init__(self, addr, size, read=None, write=None):
+        self.bEndpointAddress = addr
+        self.wMaxPacketSize = size
+        self.on_read = read
+        self.on_write = write
+
+    def read(self, size, timeout=None):
+        return self.on_read(size, timeout)
+
+    def write(self, data, timeout=None):
+        data = bytes(data)
+        self.on_write(data)
+        return len(data)
+
+
+class RemoteShadow():
+    def __init__(self, conn):
+        self.conn = conn
+
+    def get(self, addr, default=None):
+        value = self.conn.call("shadow", addr=addr)
+        return default if value is None else value
+
+    def __setitem__(self, addr, value):
+        # Not posted: other clients see the value once the write returns
+        self.conn.call("shadow", addr=addr, value=value)
+
+    def pop(self, addr, default=None):
+        self.conn.call("shadow", addr=addr, clear=True)
+
+    def clear(self):
+        self.conn.call("shadow", addr=None, clear=True)
+
+
+class RemoteDevice():
+    def __init__(self, path):
+        self.path = path
+        self.conn = DaemonConnection(path)
+        self.event_conn = None
+        self.addr = None
+        self.page = None
+        self.autoinc = False
+        self.res = bytearray()
+        self.bus, self.address = self.conn.call("info")
+
+        self.endpoints = {
+            Endpoint.DATA_OUT: RemoteEndpoint(Endpoint.DATA_OUT, PKT_SIZE,
+                write=self.data_out),
+            Endpoint.DATA_IN: RemoteEndpoint(Endpoint.DATA_IN, PKT_SIZE,
+                read=self.data_in),
+            Endpoint.CMD_OUT: RemoteEndpoint(Endpoint.CMD_OUT, PKT_SIZE,
+                write=self.cmd_out),
+            Endpoint.CMD_IN: RemoteEndpoint(Endpoint.CMD_IN, PKT_SIZE,
+                read=self.cmd_in),
+            Endpoint.EVENT_IN: RemoteEndpoint(Endpoint.EVENT_IN,
+                EVENT_PKT_SIZE, read=self.event_in),
+        }
+        atexit.register(self.close)
+
+    def ctrl_transfer(self, bmRequestType, bRequest, wValue=0, wIndex=0,
+            data_or_wLength=None, timeout=None):
+        # Register selection and FIFO loads are sent along with the transfer
+        # they prepare, so that clients never interleave between the two
+        if bRequest == Request.SELECT_CREG:
+            self.addr = wValue & 0xFF
+            return 0
+        elif bRequest == Request.LOAD_RDFIFO:
+            return 0
+        elif bRequest == Request.POLL_CREG:
+            return decode(self.conn.call("poll", **self.target(),
+                value=wValue, index=wIndex, timeout=timeout))
+
+        data = data_or_wLength
+        if data is not None and not isinstance(data, int):
+            data = bytes(data).hex()
+        res = self.conn.call("ctrl", type=bmRequestType, request=bRequest,
+                value=wValue, index=wIndex, data=data)
+        if bRequest == Request.SET_CPU_SPD:
+            self.addr = None
+            self.page = None
+            self.autoinc = False
+        return decode(res) if isinstance(res, str) else res
+
+    def target(self):
+        # PAGE writes are kept here and applied by the daemon along with
+        # the select they prepare, auto-increment included
+        target = {"addr": None, "autoinc": self.autoinc}
+        if self.addr is not None:
+            target["addr"] = page_addr(self.addr, self.page)
+        self.autoinc = False
+        return target
+
+    def data_out(self, data):
+        if self.addr == PAGE_SELECT:
+            if data:
+                self.page = data[-1] & PAGE_MASK
+                self.autoinc = bool(data[-1] & PAGE_AUTOINC)
+            return
+        self.conn.post("write", **self.target(), data=data.hex())
+
+    def data_in(self, size, timeout):
+        return decode(self.conn.call("read", **self.target(), size=size))
+
+    def cmd_out(self, data):
+        self.res += bytes.fromhex(self.conn.call("cmd", **self.target(),
+            data=data.hex()))
+        res_size, selected, page, autoinc = scan(data)
+        if page is not None:
+            self.page = page
+        if selected is not None:
+            self.addr = selected
+
+    def cmd_in(self, size, timeout):
+        data = self.res[:size]
+        del self.res[:size]
+        return array('B', data)
+
+    def event_in(self, size, timeout):
+        if self.event_conn is None:
+            self.event_conn = DaemonConnection(self.path)
+        return decode(self.event_conn.call("events", size=size,
+            timeout=timeout))
+
+    def close(self):
+        atexit.unregister(self.close)
+        for conn in [self.conn, self.event_conn]:
+            if conn is not None:
+                conn.close()
+
+
+class DaemonTransport(Transport):
+    verify_idcode = False
+
+    def __init__(self, path=None):
+        self.path = default_socket() if path is None else path
+        self.dev = None
+
+    @staticmethod
+    def available(path=None):
+        path = default_socket() if path is None else path
+        if not os.path.exists(path):
+            return False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+            return True
+        except OSError:
+            return False
+        finally:
+            sock.close()
+
+    def open(self):
+        logging.debug("Using bmii daemon at %s", self.path)
+        self.dev = RemoteDevice(self.path)
+        return self.dev
+
+    def shadow(self):
+        # Shared by all the clients, which write to the same registers
+        return RemoteShadow(self.dev.conn)
+
+    def endpoint(self, addr):
+        return self.dev.endpoints[addr]
+
+    def close(self):
+        if self.dev is not None:
+            self.dev.close()
+            self.dev = None
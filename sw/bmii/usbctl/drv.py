@@ -1,7 +1,26 @@
+from contextlib import contextmanager
 from enum import IntEnum
+import errno
+import functools
 import logging
+import threading
 import usb
 
+from bmii.regmap import CtrlRegDir, PAGE_SELECT, PAGE_AUTOINC, PAGE_MASK, \
+        RADDR_WIDTH, STALL_TIMEOUT, addr_page, creg_addr, creg_size
+from bmii.usbctl.cmd import Batch, BatchResult, PollResult, ValueResult
+from bmii.usbctl.engine import TransferEngine
+from bmii.usbctl.stats import Stats, InstrumentedDevice, InstrumentedEndpoint
+from bmii.usbctl.transport import USBTransport
+
+POLL_MAX_ITERATIONS = 0xFFFF
+# Each poll iteration is a GPIF read, which the register may stall
+POLL_ITERATION_US = STALL_TIMEOUT // 48 + 1
+POLL_TIMEOUT_MARGIN = 1000
+EVENT_QUEUE_SIZE = 32
+EVENT_QUEUE_EMPTY = 0xFF
+QUEUE_DEPTH = 4
+
 
 class bmRequestType(IntEnum):
     VENDOR_WR   = 0x40
@@ -13,6 +32,16 @@ class bRequest(IntEnum):
     LOAD_RDFIFO = 0xF1
     SET_CPU_SPD = 0xF2
     GET_EVENT   = 0xF3
+    POLL_CREG   = 0xF4
+    SET_EVENT_EP = 0xF5
+
+
+class Endpoint(IntEnum):
+    EVENT_IN    = 0x81
+    DATA_OUT    = 0x02
+    CMD_OUT     = 0x04
+    DATA_IN     = 0x86
+    CMD_IN      = 0x88
 
 
 class CPUSpd(IntEnum):
@@ -21,86 +50,397 @@ class CPUSpd(IntEnum):
     CLK_48M = 2
 
 
+def locked(func):
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
 class Driver():
-    def __init__(self):
+    def __init__(self, transport=None):
+        self.lock = threading.RLock()
+        self.transport = USBTransport() if transport is None else transport
         self.dev = None
+        self.metrics = None
+        self.selected = None
+        self.selected_creg = None
+        self.shadow = {}
+        self.cmds = None
+        self.queue_depth = QUEUE_DEPTH
+        self.engine = None
 
-    def detect(self):
-        dev = usb.core.find(idVendor=0xffff, idProduct=0xebfe)
-        if dev is None:
-            raise IOError("Device not found")
-        else:
-            logging.info("Found device (%03d:%03d)", dev.bus, dev.address)
-        return dev
+    @locked
+    def set_transport(self, transport):
+        self.detach()
+        self.transport = transport
+
+    @locked
+    def detach(self):
+        self.stop_engine()
+        if self.dev is not None:
+            self.transport.close()
+            self.dev = None
 
+    @locked
     def attach(self):
         if self.dev is not None:
             return
 
-        self.dev = self.detect()
+        self.usb_dev = self.transport.open()
+        self.usb_eps = dict([(addr, self.transport.endpoint(addr))
+            for addr in Endpoint])
+        self.invalidate()
+        self.shadow = self.transport.shadow()
+        self.instrument()
+
+        if self.transport.verify_idcode:
+            self.check_idcode()
+
+    def instrument(self):
+        dev, eps = self.usb_dev, dict(self.usb_eps)
+        if self.metrics is not None:
+            dev = InstrumentedDevice(dev, self.metrics, bRequest,
+                    self.stats_tag)
+            for addr, ep in eps.items():
+                tag = self.stats_tag
+                if addr in [Endpoint.CMD_OUT, Endpoint.CMD_IN]:
+                    tag = lambda: "batch"
+                eps[addr] = InstrumentedEndpoint(ep, self.metrics,
+                        Endpoint(addr).name, tag)
+
+        self.dev = dev
+        self.ep_wr = eps[Endpoint.DATA_OUT]
+        self.ep_rd = eps[Endpoint.DATA_IN]
+        self.ep_cmd = eps[Endpoint.CMD_OUT]
+        self.ep_res = eps[Endpoint.CMD_IN]
+        self.ep_evt = eps[Endpoint.EVENT_IN]
 
-        self.dev.set_configuration()
-        cfg = self.dev.get_active_configuration()
-        intf = cfg[(0, 0)]
+    @locked
+    def enable_stats(self, enable=True):
+        if enable and self.metrics is None:
+            self.metrics = Stats()
+        elif not enable:
+            self.metrics = None
+        if self.dev is not None:
+            self.instrument()
+
+    def reset_stats(self):
+        if self.metrics is not None:
+            self.metrics.reset()
 
-        self.ep_wr = usb.util.find_descriptor(
-                intf,
-                custom_match = \
-                        lambda e: \
-                        usb.util.endpoint_direction(e.bEndpointAddress) == \
-                        usb.util.ENDPOINT_OUT)
+    def stats(self):
+        if self.metrics is None:
+            return None
+        return self.metrics.report()
 
-        self.ep_rd = usb.util.find_descriptor(
-                intf,
-                custom_match = \
-                        lambda e: \
-                        usb.util.endpoint_direction(e.bEndpointAddress) == \
-                        usb.util.ENDPOINT_IN)
+    def stats_tag(self):
+        creg = self.selected_creg
+        if creg is None:
+            return ""
+        return "{}.{}".format(creg.iomodule.name, creg.name)
+
+    @contextmanager
+    def operation(self, name):
+        if self.metrics is None:
+            yield None
+            return
+        with self.metrics.operation(name) as frame:
+            yield frame
 
-        assert self.ep_wr is not None
-        assert self.ep_rd is not None
+    def invalidate(self):
+        self.selected = None
+        self.selected_creg = None
+        self.page = None
 
-        self.check_idcode()
+    def shadowed(self, ctrlreg):
+        return ctrlreg is not None and \
+                (ctrlreg.direction == CtrlRegDir.WRONLY or ctrlreg.cached)
 
-    def select_creg(self, ctrlreg):
+    def shadow_value(self, ctrlreg):
+        if not self.shadowed(ctrlreg):
+            return None
+        default = 0 if ctrlreg.direction == CtrlRegDir.WRONLY else None
+        return self.shadow.get(self.creg_addr(ctrlreg), default)
+
+    @locked
+    def invalidate_shadow(self, ctrlreg=None):
+        if ctrlreg is None:
+            self.shadow.clear()
+        else:
+            self.shadow.pop(self.creg_addr(ctrlreg), None)
+
+    def select_byte(self, value):
+        if self.cmds is not None:
+            self.cmds.select(value)
+        else:
+            self.dev.ctrl_transfer(bmRequestType.VENDOR_WR,
+                    bRequest.SELECT_CREG, value)
+
+    def write_page(self, value):
+        self.select_byte(PAGE_SELECT)
+        if self.cmds is not None:
+            self.cmds.write([value])
+        else:
+            self.ep_wr.write([value])
+        self.selected = PAGE_SELECT
+        self.page = value & PAGE_MASK
+
+    def set_page(self, page):
+        if page is None or page == self.page:
+            return
+        self.write_page(page)
+
+    def select_addr(self, value, autoinc=False):
+        if autoinc:
+            page = addr_page(value)
+            if page is None:
+                page = 0 if self.page is None else self.page
+            self.write_page(page | PAGE_AUTOINC)
+        elif value == self.selected:
+            return
+        else:
+            self.set_page(addr_page(value))
+        self.select_byte(value & 0xFF)
+        # Auto-increment moves the northbridge address with every transfer
+        self.selected = None if autoinc else value
+
+    def creg_addr(self, ctrlreg):
+        return creg_addr(ctrlreg.iomodule.addr, ctrlreg.addr)
+
+    @locked
+    def select_creg(self, ctrlreg, addr=None):
         self.attach()
-        value = (ctrlreg.addr << 3) | (ctrlreg.iomodule.addr)
-        self.dev.ctrl_transfer(bmRequestType.VENDOR_WR,
-                bRequest.SELECT_CREG, value)
+        self.selected_creg = ctrlreg
+        self.select_addr(self.creg_addr(ctrlreg) if addr is None else addr)
 
+    @locked
     def load_rdfifo(self, size):
         self.attach()
         self.dev.ctrl_transfer(bmRequestType.VENDOR_WR,
                 bRequest.LOAD_RDFIFO, size)
 
+    @locked
     def write(self, data):
         self.attach()
+        creg = self.selected_creg
+        size = 1 if creg is None else creg_size(creg)
+        value = None
         if isinstance(data, int):
-            data = [data]
-        self.ep_wr.write(data)
+            value = data
+            data = data.to_bytes(size, "little")
+        elif len(data) >= size:
+            value = int.from_bytes(bytes(data[-size:]), "little")
+        if self.cmds is not None:
+            self.cmds.write(data)
+        else:
+            self.ep_wr.write(data)
+        if value is not None and self.shadowed(creg):
+            self.shadow[self.selected] = value
+        if len(data) and self.selected == PAGE_SELECT:
+            self.page = data[-1] & PAGE_MASK
 
+    @locked
+    def write_burst(self, ctrlreg, data):
+        data = memoryview(data).cast("B")
+        self.select_creg(ctrlreg)
+        self.write(data)
+
+    @locked
     def read(self, size):
         self.attach()
+        creg = self.selected_creg
+        # Reading one value of a control register takes all its bytes
+        value = size == 1 and creg is not None
+        if value:
+            size = creg_size(creg)
+        cached = value and creg.cached
+        v = self.shadow.get(self.selected) if cached else None
+        if v is not None:
+            if self.cmds is None:
+                return v
+            result = ValueResult(size)
+            result.data[:] = v.to_bytes(size, "little")
+            result.done = True
+            return result
+        if self.cmds is not None:
+            return self.cmds.read(size, ValueResult(size) if value else None)
         self.load_rdfifo(size)
-        if size == 1:
-            return self.ep_rd.read(size)[0]
-        return self.ep_rd.read(size)
+        data = self.ep_rd.read(size)
+        if not value and size > 1:
+            return data
+        v = int.from_bytes(bytes(data), "little")
+        if cached:
+            self.shadow[self.selected] = v
+        return v
+
+    @locked
+    def read_burst(self, ctrlreg, size):
+        self.select_creg(ctrlreg)
+        if self.cmds is not None:
+            return self.cmds.read(size)
+        data = bytearray()
+        chunk = self.ep_rd.wMaxPacketSize
+        for offset in range(0, size, chunk):
+            n = min(chunk, size - offset)
+            self.load_rdfifo(n)
+            data += self.ep_rd.read(n)
+        return bytes(data)
+
+    @locked
+    def select_block(self, ctrlreg):
+        self.attach()
+        self.selected_creg = None
+        self.select_addr(self.creg_addr(ctrlreg), autoinc=True)
+
+    def check_block(self, ctrlreg, count):
+        assert ctrlreg.addr + count <= 1 << RADDR_WIDTH
+        # Auto-increment moves on after every byte, past a single lane
+        for c in ctrlreg.iomodule.cregs.values():
+            if ctrlreg.addr <= c.addr < ctrlreg.addr + count \
+                    and creg_size(c) != 1:
+                raise ValueError("Cannot transfer {} in a block: wider than a byte".\
+                        format(c.name))
+
+    @locked
+    def read_block(self, ctrlreg, count):
+        self.check_block(ctrlreg, count)
+        self.select_block(ctrlreg)
+        if self.cmds is not None:
+            return self.cmds.read(count)
+        self.load_rdfifo(count)
+        return bytes(self.ep_rd.read(count))
+
+    @locked
+    def write_block(self, ctrlreg, data):
+        data = bytes(data)
+        self.check_block(ctrlreg, len(data))
+        self.select_block(ctrlreg)
+        self.write(data)
+        for c in ctrlreg.iomodule.cregs.values():
+            if ctrlreg.addr <= c.addr < ctrlreg.addr + len(data) \
+                    and self.shadowed(c):
+                self.shadow[self.creg_addr(c)] = data[c.addr - ctrlreg.addr]
+
+    @locked
+    def poll(self, ctrlreg, mask, value, iterations=POLL_MAX_ITERATIONS):
+        if creg_size(ctrlreg) != 1:
+            raise ValueError("Cannot poll {}: wider than a byte".\
+                    format(ctrlreg.name))
+        self.select_creg(ctrlreg)
+        if self.cmds is not None:
+            return self.cmds.poll(mask, value, iterations)
+        result = PollResult(mask, value)
+        result.data[:] = self.dev.ctrl_transfer(bmRequestType.VENDOR_RD,
+                bRequest.POLL_CREG, (mask << 8) | value, iterations,
+                result.size, POLL_TIMEOUT_MARGIN
+                + iterations * POLL_ITERATION_US // 1000)
+        result.done = True
+        return result
+
+    @locked
+    def read_many(self, cregs):
+        if any(creg_size(c) != 1 for c in cregs):
+            # Gathering reads a single byte per register
+            with self.batch():
+                results = []
+                for c in cregs:
+                    self.select_creg(c)
+                    results.append(self.read(1))
+            if self.cmds is not None:
+                return results
+            return [r.value for r in results]
+
+        addrs = [self.creg_addr(c) for c in cregs]
+        if not addrs:
+            return []
+        with self.batch() as cmds:
+            result = BatchResult(len(addrs))
+            start = 0
+            while start < len(addrs):
+                # Gathered select bytes all use the page set beforehand
+                self.set_page(addr_page(addrs[start]))
+                end = start + 1
+                while end < len(addrs) and \
+                        addr_page(addrs[end]) in [None, self.page]:
+                    end += 1
+                cmds.gather([a & 0xFF for a in addrs[start:end]], result, start)
+                start = end
+            self.selected = addrs[-1]
+            self.selected_creg = cregs[-1]
+        if not result.done:
+            return result
+        return list(result.data)
+
+    @contextmanager
+    def batch(self):
+        with self.lock:
+            if self.cmds is not None:
+                yield self.cmds
+                return
+
+            self.attach()
+            self.cmds = Batch(self)
+            try:
+                yield self.cmds
+                cmds, self.cmds = self.cmds, None
+                cmds.flush()
+            except:
+                self.invalidate()
+                self.invalidate_shadow()
+                raise
+            finally:
+                self.cmds = None
+
+    def set_queue_depth(self, depth):
+        assert depth > 0
+        self.stop_engine()
+        self.queue_depth = depth
+
+    def stop_engine(self):
+        if self.engine is not None:
+            self.engine.stop()
+            self.engine = None
+
+    def submit(self, func, *args, **kwargs):
+        if self.engine is None:
+            self.engine = TransferEngine(self.queue_depth)
+        if self.metrics is not None:
+            func = self.metrics.bind(func)
+        return self.engine.submit(func, *args, **kwargs)
+
+    def read_async(self, ctrlreg, size):
+        return self.submit(self.read_burst, ctrlreg, size)
+
+    def write_async(self, ctrlreg, data):
+        return self.submit(self.write_burst, ctrlreg, data)
+
+    async def aread(self, ctrlreg, size):
+        import asyncio
+        return await asyncio.wrap_future(self.read_async(ctrlreg, size))
+
+    async def awrite(self, ctrlreg, data):
+        import asyncio
+        return await asyncio.wrap_future(self.write_async(ctrlreg, data))
 
     def check_idcode(self):
-        self.dev.ctrl_transfer(bmRequestType.VENDOR_WR,
-                bRequest.SELECT_CREG, 0)
+        self.select_addr(0)
         idcode = self.read(1)
         logging.info("IDCODE: %X", idcode)
         if (idcode != 0xA5):
             logging.warning("Unknown IDCODE")
 
+    @locked
     def set_cpu_speed(self, freq):
         assert type(freq) is CPUSpd
         self.attach()
         logging.debug("Setting CPU clock at %sHz", str(freq)[-3:])
         self.dev.ctrl_transfer(bmRequestType.VENDOR_WR,
                 bRequest.SET_CPU_SPD, freq)
+        self.invalidate()
 
+    @locked
     def get_event(self):
         self.attach()
         return self.dev.ctrl_transfer(
@@ -109,3 +449,30 @@ class Driver():
             wValue=0,
             wIndex=0,
             data_or_wLength=1)[0]
+
+    @locked
+    def get_events(self, size=EVENT_QUEUE_SIZE):
+        self.attach()
+        evts = self.dev.ctrl_transfer(
+            bmRequestType=bmRequestType.VENDOR_RD,
+            bRequest=bRequest.GET_EVENT,
+            wValue=0,
+            wIndex=0,
+            data_or_wLength=size)
+        return [e for e in evts if e != EVENT_QUEUE_EMPTY]
+
+    @locked
+    def enable_event_ep(self, enable=True):
+        self.attach()
+        self.dev.ctrl_transfer(bmRequestType.VENDOR_WR,
+                bRequest.SET_EVENT_EP, int(enable))
+
+    def wait_events(self, timeout=None):
+        self.attach()
+        try:
+            return list(self.ep_evt.read(self.ep_evt.wMaxPacketSize,
+                0 if timeout is None else timeout))
+        except usb.core.USBError as e:
+            if e.errno == errno.ETIMEDOUT:
+                return []
+            raise
@@ -0,0 +1,37 @@
+from concurrent.futures import Future
+import logging
+import queue
+import threading
+
+
+class TransferEngine():
+    def __init__(self, depth):
+        self.depth = depth
+        self.queue = queue.Queue(depth)
+        self.thread = threading.Thread(target=self.run,
+                name="bmii-transfer", daemon=True)
+        self.thread.start()
+
+    def submit(self, func, *args, **kwargs):
+        future = Future()
+        self.queue.put((future, func, args, kwargs))
+        return future
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+
+            future, func, args, kwargs = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(*args, **kwargs))
+            except BaseException as e:
+                logging.debug("Transfer failed: %s", e)
+                future.set_exception(e)
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
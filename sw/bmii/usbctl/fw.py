@@ -5,6 +5,7 @@ import subprocess
 import sys
 import usb
 
+from bmii.usbctl.transport import find_devices
 from bmii.usbctl.utils import ninja_syntax
 
 
@@ -21,6 +22,8 @@ def obj(f):
 
 
 class Firmware():
+    device = None
+
     def prepare(self):
         pass
 
@@ -32,8 +35,7 @@ class Firmware():
                 (0x04b4, 0x8613),
                 (0x09fb, 0x6001)]
         for i in ids:
-            dev = usb.core.find(idVendor=i[0], idProduct=i[1])
-            if dev != None:
+            for dev in find_devices(i[0], i[1], self.device):
                 if dev.idVendor == 0x09fb and \
                     usb.util.get_string(dev, 2) != "USB-JTAG-BM":
                     logging.debug("Found genuine USB Blaster: %s. Ignoring",
@@ -77,6 +79,7 @@ class BMIIFirmware(Firmware):
         self.ihex = os.path.join(self.builddir, "bmii_fw.ihx")
 
         self.csources = [
+                'cmd',
                 'gpif',
                 'gpifisr',
                 'io',
@@ -0,0 +1,87 @@
+#include "cmd.h"
+#include "delay.h"
+#include "fx2macros.h"
+#include "fx2regs.h"
+#include "fx2sdly.h"
+#include "io.h"
+
+static WORD res_len;
+
+static void res_commit(void)
+{
+    if (!res_len)
+        return;
+
+    EP8BCH = MSB(res_len);
+    SYNCDELAY;
+    EP8BCL = LSB(res_len);
+    SYNCDELAY;
+    res_len = 0;
+
+    while (EP2468STAT & bmEP8FULL)
+        continue;
+}
+
+static void res_push(BYTE value)
+{
+    EP8FIFOBUF[res_len++] = value;
+    if (res_len == CMD_PKT_SIZE)
+        res_commit();
+}
+
+void cmd_run(void)
+{
+    WORD len = MAKEWORD(EP4BCH, EP4BCL);
+    WORD i = 0;
+    WORD it;
+    BYTE n;
+
+    io_lock();
+
+    while (i < len) {
+        switch (EP4FIFOBUF[i++]) {
+            case CMD_SELECT:
+                io_select_reg(EP4FIFOBUF[i++]);
+                break;
+            case CMD_WRITE:
+                n = EP4FIFOBUF[i++];
+                while (n--)
+                    io_sgl_write(EP4FIFOBUF[i++]);
+                break;
+            case CMD_READ:
+                n = EP4FIFOBUF[i++];
+                while (n--)
+                    res_push(io_sgl_read());
+                break;
+            case CMD_DELAY:
+                n = EP4FIFOBUF[i++];
+                if (n)
+                    delay(n);
+                break;
+            case CMD_POLL:
+                it = io_poll(EP4FIFOBUF[i], EP4FIFOBUF[i + 1],
+                        MAKEWORD(EP4FIFOBUF[i + 3], EP4FIFOBUF[i + 2]));
+                i += 4;
+                res_push(io_poll_value);
+                res_push(LSB(it));
+                res_push(MSB(it));
+                break;
+            case CMD_GATHER:
+                n = EP4FIFOBUF[i++];
+                while (n--) {
+                    io_select_reg(EP4FIFOBUF[i++]);
+                    res_push(io_sgl_read());
+                }
+                break;
+            default:
+                // Unknown opcode: drop the rest of the packet
+                i = len;
+        }
+    }
+
+    res_commit();
+    io_unlock();
+
+    EP4BCL = 0x80;
+    SYNCDELAY;
+}
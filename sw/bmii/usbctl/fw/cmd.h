@@ -0,0 +1,19 @@
+#ifndef CMD_H
+#define CMD_H
+
+#include "fx2types.h"
+
+enum cmd_opcode {
+    CMD_SELECT  = 0x01,
+    CMD_WRITE   = 0x02,
+    CMD_READ    = 0x03,
+    CMD_DELAY   = 0x04,
+    CMD_POLL    = 0x05,
+    CMD_GATHER  = 0x06,
+};
+
+#define CMD_PKT_SIZE    512
+
+void cmd_run(void);
+
+#endif /* CMD_H */
@@ -1,9 +1,9 @@
 #include "fx2ints.h"
 #include "gpif.h"
 #include "intr.h"
+#include "io.h"
 #include "led.h"
 
-#define EVENT_QUEUE_SIZE    32
 
 struct event_queue {
     BYTE begin;
@@ -14,6 +14,8 @@ struct event_queue {
 
 static volatile __bit mutex;
 static struct event_queue eq;
+static __bit event_ep_enabled;
+static __bit event_queue_overflow;
 
 static inline void event_queue_lock(void)
 {
@@ -43,6 +45,7 @@ static inline void event_queue_enqueue(BYTE value)
 
     if (eq.size >= EVENT_QUEUE_SIZE) {
         EX0 = 0;
+        event_queue_overflow = 1;
         goto error_full;
     }
 
@@ -69,11 +72,47 @@ BYTE event_queue_dequeue()
     eq.begin = (eq.begin + 1) % EVENT_QUEUE_SIZE;
     eq.size -= 1;
 
+    if (event_queue_overflow) {
+        event_queue_overflow = 0;
+        EX0 = 1;
+    }
+
 error_empty:
     event_queue_unlock();
     return value;
 }
 
+BYTE event_queue_drain(volatile __xdata BYTE *buf, BYTE len)
+{
+    BYTE n = 0;
+    BYTE value;
+
+    while (n < len) {
+        value = event_queue_dequeue();
+        if (value == EVENT_QUEUE_EMPTY)
+            break;
+        buf[n++] = value;
+    }
+
+    return n;
+}
+
+void event_ep_enable(BYTE enable)
+{
+    event_ep_enabled = enable ? 1 : 0;
+}
+
+void event_ep_service(void)
+{
+    BYTE n;
+
+    if (!event_ep_enabled || (EP1INCS & bmEPBUSY))
+        return;
+
+    n = event_queue_drain(EP1INBUF, EVENT_EP_SIZE);
+    if (n)
+        EP1INBC = n;
+}
 
 void int0_init(void)
 {
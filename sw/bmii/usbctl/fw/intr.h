@@ -6,7 +6,13 @@
 void int0_init(void);
 void int0_isr(void) __interrupt IE0_ISR;
 
+#define EVENT_QUEUE_SIZE    32
 #define EVENT_QUEUE_EMPTY   0xFF
 BYTE event_queue_dequeue();
+BYTE event_queue_drain(volatile __xdata BYTE *buf, BYTE len);
+
+#define EVENT_EP_SIZE       64
+void event_ep_enable(BYTE enable);
+void event_ep_service(void);
 
 #endif /* INTR_H */
@@ -1,19 +1,62 @@
 #include "io.h"
 #include "led.h"
+#include "fx2macros.h"
 #include "fx2regs.h"
 #include "fx2sdly.h"
 #include "gpif.h"
 
+// Single transactions normally select a register (waveform 1) or
+// acknowledge an interrupt (waveform 0). The data mapping runs them
+// through the FIFO waveforms instead so that the CPU can read and write
+// the selected register one byte at a time.
+#define WFSELECT_DEFAULT    0x4E
+#define WFSELECT_DATA       0xEE
+
+// Flow control is patched over the GPIF Designer export so that it
+// survives the next one: the FIFO read (waveform 2) and write (waveform 3)
+// waveforms hold act high on a decision point until RDY1 (iomodule_rdy).
+#define WAVE_SIZE           32
+#define WAVE_OPCODE         8
+#define WAVE_OUTPUT         16
+#define WAVE_LFUN           24
+#define LFUN_RDY1_AND_RDY1  0x09
+
+static __bit ex0_saved;
+
+BYTE io_poll_value;
+
+static void io_wait_rdy1(BYTE wave, BYTE state, BYTE output)
+{
+    __xdata volatile BYTE *w = &GPIF_WAVE_DATA + wave * WAVE_SIZE + state;
+
+    // Then the next state, else loop
+    w[0] = ((state + 1) << 3) | state;
+    w[WAVE_OPCODE] = bmBIT0;
+    w[WAVE_OUTPUT] = output;
+    w[WAVE_LFUN] = LFUN_RDY1_AND_RDY1;
+}
+
 void io_init(void)
 {
+    io_wait_rdy1(2, 0, 0x01);
+    io_wait_rdy1(3, 2, 0x03);
+
     EP2CFG = 0xA2;
     SYNCDELAY;
     EP2CFG = 0xA2;
     SYNCDELAY;
+    EP4CFG = 0xA0;
+    SYNCDELAY;
+    EP8CFG = 0xE0;
+    SYNCDELAY;
     FIFORESET = 0x80;
     SYNCDELAY;
     FIFORESET = 0x82;
     SYNCDELAY;
+    FIFORESET = 0x84;
+    SYNCDELAY;
+    FIFORESET = 0x88;
+    SYNCDELAY;
     FIFORESET = 0x00;
     SYNCDELAY;
     OUTPKTEND = 0x82;
@@ -31,19 +74,35 @@ void io_init(void)
     EP6AUTOINLENL = 0x01;
     SYNCDELAY;
 
-    EP1INCFG &= ~bmVALID;
+    EP4FIFOCFG = 0x00;  // EP4 is AUTOOUT=0, the CPU interprets commands
     SYNCDELAY;
-    EP1OUTCFG &= ~bmVALID;
+    EP8FIFOCFG = 0x00;  // EP8 is AUTOIN=0, the CPU commits results
     SYNCDELAY;
-    EP4CFG &= ~bmVALID;
+
+    EP1INCFG = 0xB0;    // EP1IN is an interrupt endpoint for events
     SYNCDELAY;
-    EP8CFG &= ~bmVALID;
+    EP1OUTCFG &= ~bmVALID;
     SYNCDELAY;
 
     EP2BCL = 0x80;
     SYNCDELAY;
     EP2BCL = 0x80;
     SYNCDELAY;
+    EP4BCL = 0x80;
+    SYNCDELAY;
+    EP4BCL = 0x80;
+    SYNCDELAY;
+}
+
+void io_lock(void)
+{
+    ex0_saved = EX0;
+    EX0 = 0;
+}
+
+void io_unlock(void)
+{
+    EX0 = ex0_saved;
 }
 
 void io_select_reg(BYTE addr)
@@ -54,23 +113,26 @@ void io_select_reg(BYTE addr)
     XGPIFSGLDATLX = addr;
 }
 
-void io_load_rdfifo(BYTE size)
+void io_load_rdfifo(WORD size)
 {
     volatile BYTE dummy;
 
+    if (size > IO_RDFIFO_MAX)
+        size = IO_RDFIFO_MAX;
+
     wait_gpif_done();
 
-    GPIFTCB0 = size;
+    GPIFTCB0 = LSB(size);
     SYNCDELAY;
-    GPIFTCB1 = 0;
+    GPIFTCB1 = MSB(size);
     SYNCDELAY;
     GPIFTCB2 = 0;
     SYNCDELAY;
     GPIFTCB3 = 0;
 
-    EP6AUTOINLENH = 0x00;
+    EP6AUTOINLENH = MSB(size);
     SYNCDELAY;
-    EP6AUTOINLENL = size;
+    EP6AUTOINLENL = LSB(size);
     SYNCDELAY;
 
     dummy = EP6GPIFTRIG;
@@ -80,9 +142,9 @@ void io_write_data(void)
 {
     wait_gpif_done();
 
-    GPIFTCB0 = 1;
+    GPIFTCB0 = EP2FIFOBCL;
     SYNCDELAY;
-    GPIFTCB1 = 0;
+    GPIFTCB1 = EP2FIFOBCH;
     SYNCDELAY;
     GPIFTCB2 = 0;
     SYNCDELAY;
@@ -90,3 +152,42 @@ void io_write_data(void)
     SYNCDELAY;
     EP2GPIFTRIG = 0xFF;
 }
+
+void io_sgl_write(BYTE value)
+{
+    wait_gpif_done();
+
+    GPIFWFSELECT = WFSELECT_DATA;
+    XGPIFSGLDATH = 0;
+    XGPIFSGLDATLX = value;
+
+    wait_gpif_done();
+    GPIFWFSELECT = WFSELECT_DEFAULT;
+}
+
+BYTE io_sgl_read(void)
+{
+    volatile BYTE dummy;
+
+    wait_gpif_done();
+
+    GPIFWFSELECT = WFSELECT_DATA;
+    dummy = XGPIFSGLDATLX;
+
+    wait_gpif_done();
+    GPIFWFSELECT = WFSELECT_DEFAULT;
+
+    return XGPIFSGLDATLNOX;
+}
+
+WORD io_poll(BYTE mask, BYTE value, WORD timeout)
+{
+    WORD i = 0;
+
+    for (;;) {
+        io_poll_value = io_sgl_read();
+        ++i;
+        if ((io_poll_value & mask) == value || i == timeout)
+            return i;
+    }
+}
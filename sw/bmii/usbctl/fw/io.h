@@ -1,11 +1,22 @@
 #ifndef IO_H
 #define IO_H
 
+#include "fx2regs.h"
 #include "fx2types.h"
 
+#define IO_RDFIFO_MAX   512
+
 void io_init(void);
 void io_select_reg(BYTE addr);
-void io_load_rdfifo(BYTE addr);
+void io_load_rdfifo(WORD size);
 void io_write_data(void);
 
+void io_lock(void);
+void io_unlock(void);
+void io_sgl_write(BYTE value);
+BYTE io_sgl_read(void);
+
+extern BYTE io_poll_value;
+WORD io_poll(BYTE mask, BYTE value, WORD timeout);
+
 #endif /* IO_H */
@@ -1,3 +1,4 @@
+#include "cmd.h"
 #include "delay.h"
 #include "eputils.h"
 #include "gpif.h"
@@ -77,6 +78,13 @@ void main(void)
             io_write_data();
         }
 
+        if (!(EP2468STAT & bmEP4EMPTY)) {
+            gpif_enable();
+            cmd_run();
+        }
+
+        event_ep_service();
+
         wait_gpif_done();
         gpif_disable();
     }
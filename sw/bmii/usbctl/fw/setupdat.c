@@ -78,22 +78,45 @@ static int handle_vendor_command(void)
         LOAD_RDFIFO = 0xF1,
         SET_CPU_SPD = 0xF2,
         GET_EVENT   = 0xF3,
+        POLL_CREG   = 0xF4,
+        SET_EVENT_EP = 0xF5,
     };
+    WORD it;
+    BYTE n;
 
     switch (SETUPDAT[1]) {
         case SELECT_CREG:
             io_select_reg(SETUPDAT[2]);
             return 0;
         case LOAD_RDFIFO:
-            io_load_rdfifo(SETUPDAT[2]);
+            io_load_rdfifo(MAKEWORD(SETUPDAT[3], SETUPDAT[2]));
             return 0;
         case SET_CPU_SPD:
             set_cpu_freq(SETUPDAT[2]);
             return 0;
         case GET_EVENT:
-            EP0BUF[0] = event_queue_dequeue();
+            n = SETUPDAT[6];
+            if (SETUPDAT[7] || n > EVENT_QUEUE_SIZE)
+                n = EVENT_QUEUE_SIZE;
+            n = event_queue_drain(EP0BUF, n);
+            if (!n)
+                EP0BUF[n++] = EVENT_QUEUE_EMPTY;
             EP0BCH = 0;
-            EP0BCL = 1;
+            EP0BCL = n;
+            return 0;
+        case POLL_CREG:
+            io_lock();
+            it = io_poll(SETUPDAT[3], SETUPDAT[2],
+                    MAKEWORD(SETUPDAT[5], SETUPDAT[4]));
+            io_unlock();
+            EP0BUF[0] = io_poll_value;
+            EP0BUF[1] = LSB(it);
+            EP0BUF[2] = MSB(it);
+            EP0BCH = 0;
+            EP0BCL = 3;
+            return 0;
+        case SET_EVENT_EP:
+            event_ep_enable(SETUPDAT[2]);
             return 0;
         default:
             return 1;
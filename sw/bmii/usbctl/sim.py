@@ -0,0 +1,295 @@
+from array import array
+from concurrent.futures import Future
+import errno
+import logging
+import queue
+import threading
+import time
+import usb
+
+from migen import *
+
+from bmii.usbctl.cmd import Opcode
+from bmii.usbctl.drv import bRequest as Request, Endpoint, \
+        EVENT_QUEUE_SIZE, EVENT_QUEUE_EMPTY
+from bmii.usbctl.transport import Transport
+
+PKT_SIZE = 512
+EVENT_PKT_SIZE = 64
+RDFIFO_MAX = 512
+SETTLE_CYCLES = 2
+IDLE_CYCLES = 256
+# The simulator does not keep real time: nothing in the model depends on
+# it, so DELAY only lets the design run for a few cycles per millisecond
+CYCLES_PER_MS = 4
+
+
+def timeout_error():
+    return usb.core.USBError("Operation timed out", errno=errno.ETIMEDOUT)
+
+
+class SimEndpoint():
+    def __init__(self, addr, size, read=None, write=None):
+        self.bEndpointAddress = addr
+        self.wMaxPacketSize = size
+        self.on_read = read
+        self.on_write = write
+
+    def read(self, size, timeout=None):
+        return array('B', self.on_read(size, timeout))
+
+    def write(self, data, timeout=None):
+        data = bytes(data)
+        self.on_write(data)
+        return len(data)
+
+
+class SimDevice():
+    bus = 0
+    address = 0
+
+    def __init__(self, ioctl):
+        self.ioctl = ioctl
+        self.nb = ioctl.nb
+        self.jobs = queue.Queue()
+        self.rdfifo = bytearray()
+        self.res = bytearray()
+        self.events = []
+        self.event_ep_enabled = False
+        self.event_cond = threading.Condition()
+
+        self.endpoints = {
+            Endpoint.DATA_OUT: SimEndpoint(Endpoint.DATA_OUT, PKT_SIZE,
+                write=self.data_out),
+            Endpoint.DATA_IN: SimEndpoint(Endpoint.DATA_IN, PKT_SIZE,
+                read=self.data_in),
+            Endpoint.CMD_OUT: SimEndpoint(Endpoint.CMD_OUT, PKT_SIZE,
+                write=self.cmd_out),
+            Endpoint.CMD_IN: SimEndpoint(Endpoint.CMD_IN, PKT_SIZE,
+                read=self.cmd_in),
+            Endpoint.EVENT_IN: SimEndpoint(Endpoint.EVENT_IN, EVENT_PKT_SIZE,
+                read=self.event_in),
+        }
+
+        self.nb.connect_ibus()
+        self.thread = threading.Thread(target=run_simulation,
+                args=(self.ioctl, self.process()),
+                name="bmii-sim", daemon=True)
+        self.thread.start()
+
+    # Host side
+
+    def call(self, func, *args):
+        future = Future()
+        self.jobs.put((future, func, args))
+        return future.result()
+
+    def stop(self):
+        self.jobs.put(None)
+        self.thread.join()
+
+    def ctrl_transfer(self, bmRequestType, bRequest, wValue=0, wIndex=0,
+            data_or_wLength=None, timeout=None):
+        if bRequest == Request.SELECT_CREG:
+            self.call(self.select, wValue & 0xFF)
+        elif bRequest == Request.LOAD_RDFIFO:
+            self.call(self.load_rdfifo, min(wValue, RDFIFO_MAX))
+        elif bRequest == Request.SET_CPU_SPD:
+            logging.debug("Simulated CPU clock change ignored")
+        elif bRequest == Request.GET_EVENT:
+            self.call(self.idle, SETTLE_CYCLES)
+            evts = self.drain_events(min(data_or_wLength, EVENT_QUEUE_SIZE))
+            return array('B', evts or [EVENT_QUEUE_EMPTY])
+        elif bRequest == Request.POLL_CREG:
+            return array('B', self.call(self.poll,
+                wValue >> 8, wValue & 0xFF, wIndex))
+        elif bRequest == Request.SET_EVENT_EP:
+            with self.event_cond:
+                self.event_ep_enabled = bool(wValue)
+                self.event_cond.notify_all()
+        else:
+            raise usb.core.USBError("Pipe error", errno=errno.EPIPE)
+        return 0
+
+    def data_out(self, data):
+        self.call(self.write, data)
+
+    def data_in(self, size, timeout):
+        if not self.rdfifo:
+            raise timeout_error()
+        data = self.rdfifo[:size]
+        del self.rdfifo[:size]
+        return data
+
+    def cmd_out(self, data):
+        self.res += self.call(self.run_cmds, data)
+
+    def cmd_in(self, size, timeout):
+        if not self.res:
+            raise timeout_error()
+        data = self.res[:size]
+        del self.res[:size]
+        return data
+
+    def drain_events(self, size):
+        with self.event_cond:
+            evts = self.events[:size]
+            del self.events[:size]
+            return evts
+
+    def event_in(self, size, timeout):
+        deadline = None if not timeout else time.monotonic() + timeout / 1000
+        while True:
+            with self.event_cond:
+                if self.event_ep_enabled and self.events:
+                    size = min(size, EVENT_PKT_SIZE)
+                    evts = self.events[:size]
+                    del self.events[:size]
+                    return evts
+            if deadline is not None and time.monotonic() > deadline:
+                raise timeout_error()
+            # Let the model run while the host waits for an interrupt
+            self.call(self.idle, IDLE_CYCLES)
+
+    # Simulation side
+
+    def process(self):
+        yield from self.idle(SETTLE_CYCLES)
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+
+            future, func, args = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result((yield from func(*args)))
+            except Exception as e:
+                future.set_exception(e)
+            yield from self.idle(SETTLE_CYCLES)
+
+    def idle(self, cycles):
+        for i in range(cycles):
+            yield
+            yield from self.service_interrupt()
+
+    def cycle(self, wr, la, data=0):
+        yield self.nb.fdt.i.eq(data)
+        yield self.nb.wr.eq(wr)
+        yield self.nb.la.eq(la)
+        yield self.nb.act.eq(1)
+        yield
+        # Data transfers wait for the addressed module, as the GPIF does
+        while not la and not (yield self.nb.iomodule_rdy):
+            yield
+        value = (yield self.nb.fdt.o)
+        yield self.nb.act.eq(0)
+        yield self.nb.wr.eq(0)
+        yield self.nb.la.eq(0)
+        yield
+        yield
+        return value
+
+    def select(self, addr):
+        # The firmware services interrupts between GPIF transactions
+        yield from self.service_interrupt()
+        yield from self.cycle(1, 1, addr)
+
+    def sgl_write(self, value):
+        yield from self.cycle(1, 0, value)
+
+    def sgl_read(self):
+        return (yield from self.cycle(0, 0))
+
+    def write(self, data):
+        for value in data:
+            yield from self.sgl_write(value)
+
+    def load_rdfifo(self, size):
+        for i in range(size):
+            self.rdfifo.append((yield from self.sgl_read()))
+
+    def poll(self, mask, value, timeout):
+        i = 0
+        while True:
+            v = yield from self.sgl_read()
+            i += 1
+            if (v & mask) == value or i == timeout:
+                return [v, i & 0xFF, (i >> 8) & 0xFF]
+
+    def delay(self, ms):
+        for i in range(ms * CYCLES_PER_MS):
+            yield
+
+    def run_cmds(self, pkt):
+        res = bytearray()
+        i = 0
+        while i < len(pkt):
+            op = pkt[i]
+            i += 1
+            if op == Opcode.SELECT:
+                yield from self.select(pkt[i])
+                i += 1
+            elif op == Opcode.WRITE:
+                n = pkt[i]
+                yield from self.write(pkt[i + 1:i + 1 + n])
+                i += 1 + n
+            elif op == Opcode.READ:
+                for j in range(pkt[i]):
+                    res.append((yield from self.sgl_read()))
+                i += 1
+            elif op == Opcode.DELAY:
+                yield from self.delay(pkt[i])
+                i += 1
+            elif op == Opcode.POLL:
+                res += bytes((yield from self.poll(pkt[i], pkt[i + 1],
+                        pkt[i + 2] | (pkt[i + 3] << 8))))
+                i += 4
+            elif op == Opcode.GATHER:
+                n = pkt[i]
+                for addr in pkt[i + 1:i + 1 + n]:
+                    yield from self.select(addr)
+                    res.append((yield from self.sgl_read()))
+                i += 1 + n
+            else:
+                logging.warning("Unknown simulated opcode %#x", op)
+                break
+        return res
+
+    def service_interrupt(self):
+        if (yield self.nb.intr[0]):
+            return
+        with self.event_cond:
+            if len(self.events) >= EVENT_QUEUE_SIZE:
+                return
+
+        evt = yield from self.cycle(0, 1)
+
+        with self.event_cond:
+            self.events.append(evt)
+            self.event_cond.notify_all()
+
+
+class SimTransport(Transport):
+    def __init__(self, ioctl):
+        self.ioctl = ioctl
+        self.dev = None
+        self.stopped = False
+
+    def open(self):
+        if self.stopped:
+            raise IOError("Simulated device cannot be reopened")
+        if self.dev is None:
+            logging.info("Using simulated device")
+            self.dev = SimDevice(self.ioctl)
+        return self.dev
+
+    def endpoint(self, addr):
+        return self.dev.endpoints[addr]
+
+    def close(self):
+        if self.dev is not None:
+            self.dev.stop()
+            self.dev = None
+            self.stopped = True
@@ -0,0 +1,228 @@
+from collections import defaultdict
+from contextlib import contextmanager
+import sys
+import threading
+import time
+
+HIST_BUCKETS = 32
+
+
+class Histogram():
+    def __init__(self):
+        self.buckets = [0] * HIST_BUCKETS
+        self.count = 0
+        self.total = 0
+
+    def add(self, us):
+        self.buckets[min(int(us).bit_length(), HIST_BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += us
+
+    def percentile(self, p):
+        if not self.count:
+            return 0
+        rank = max(1, -(-self.count * p // 100))
+        acc = 0
+        for b, n in enumerate(self.buckets):
+            acc += n
+            if acc >= rank:
+                # Upper bound of the bucket, in microseconds
+                return 1 << b
+        return 1 << (HIST_BUCKETS - 1)
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+
+class TransferCounter():
+    def __init__(self):
+        self.nbytes = 0
+        self.latency = Histogram()
+
+    def add(self, nbytes, us):
+        self.nbytes += nbytes
+        self.latency.add(us)
+
+
+class OpFrame():
+    def __init__(self):
+        self.transfers = 0
+        self.nbytes = 0
+
+
+class OpCounter():
+    def __init__(self):
+        self.calls = 0
+        self.transfers = 0
+        self.nbytes = 0
+        self.elapsed = 0
+
+
+class Stats():
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.transfers = defaultdict(TransferCounter)
+            self.operations = defaultdict(OpCounter)
+
+    def record(self, kind, request, tag, nbytes, elapsed):
+        with self.lock:
+            self.transfers[(kind, request, tag)].add(nbytes, elapsed * 1e6)
+            for frame in getattr(self.local, "frames", ()):
+                frame.transfers += 1
+                frame.nbytes += nbytes
+
+    def bind(self, func):
+        # Transfers of a job run by another thread count towards the
+        # operations open in the thread submitting it
+        frames = list(getattr(self.local, "frames", ()))
+
+        def run(*args, **kwargs):
+            saved = getattr(self.local, "frames", [])
+            self.local.frames = saved + frames
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.local.frames = saved
+
+        return run
+
+    @contextmanager
+    def operation(self, name):
+        if not hasattr(self.local, "frames"):
+            self.local.frames = []
+        frame = OpFrame()
+        self.local.frames.append(frame)
+        start = time.perf_counter()
+        try:
+            yield frame
+        finally:
+            elapsed = time.perf_counter() - start
+            self.local.frames.remove(frame)
+            with self.lock:
+                op = self.operations[name]
+                op.calls += 1
+                op.transfers += frame.transfers
+                op.nbytes += frame.nbytes
+                op.elapsed += elapsed
+
+    def report(self):
+        with self.lock:
+            transfers = []
+            total = Histogram()
+            total_bytes = 0
+            for (kind, request, tag), c in sorted(self.transfers.items()):
+                transfers.append({
+                    "kind": kind,
+                    "request": request,
+                    "register": tag,
+                    "count": c.latency.count,
+                    "bytes": c.nbytes,
+                    "mean_us": round(c.latency.mean(), 1),
+                    "p50_us": c.latency.percentile(50),
+                    "p99_us": c.latency.percentile(99),
+                })
+                for b, n in enumerate(c.latency.buckets):
+                    total.buckets[b] += n
+                total.count += c.latency.count
+                total.total += c.latency.total
+                total_bytes += c.nbytes
+
+            operations = []
+            for name, op in sorted(self.operations.items()):
+                operations.append({
+                    "name": name,
+                    "calls": op.calls,
+                    "transfers": op.transfers,
+                    "transfers_per_call": round(op.transfers / op.calls, 1),
+                    "bytes": op.nbytes,
+                    "elapsed_s": round(op.elapsed, 6),
+                })
+
+        return {
+            "totals": {
+                "count": total.count,
+                "bytes": total_bytes,
+                "mean_us": round(total.mean(), 1),
+                "p50_us": total.percentile(50),
+                "p99_us": total.percentile(99),
+            },
+            "transfers": transfers,
+            "operations": operations,
+        }
+
+    @staticmethod
+    def dump(report, f=sys.stdout):
+        t = report["totals"]
+        f.write("Transfers: {} ({} bytes), p50 <{}us, p99 <{}us\n".format(
+            t["count"], t["bytes"], t["p50_us"], t["p99_us"]))
+
+        f.write("\n{:<5} {:<12} {:<24} {:>8} {:>10} {:>8} {:>8}\n".format(
+            "KIND", "REQUEST", "REGISTER", "COUNT", "BYTES", "P50", "P99"))
+        for r in report["transfers"]:
+            f.write("{:<5} {:<12} {:<24} {:>8} {:>10} {:>8} {:>8}\n".format(
+                r["kind"], r["request"], r["register"], r["count"],
+                r["bytes"], "<{}us".format(r["p50_us"]),
+                "<{}us".format(r["p99_us"])))
+
+        if report["operations"]:
+            f.write("\n{:<32} {:>8} {:>10} {:>10} {:>10}\n".format(
+                "OPERATION", "CALLS", "TRANSFERS", "PER CALL", "TIME"))
+            for op in report["operations"]:
+                f.write("{:<32} {:>8} {:>10} {:>10} {:>9.3f}s\n".format(
+                    op["name"], op["calls"], op["transfers"],
+                    op["transfers_per_call"], op["elapsed_s"]))
+
+
+class InstrumentedDevice():
+    def __init__(self, dev, stats, requests, tag):
+        self.dev = dev
+        self.stats = stats
+        self.requests = requests
+        self.tag = tag
+
+    def ctrl_transfer(self, bmRequestType, bRequest, wValue=0, wIndex=0,
+            data_or_wLength=None, timeout=None):
+        start = time.perf_counter()
+        ret = self.dev.ctrl_transfer(bmRequestType, bRequest, wValue, wIndex,
+                data_or_wLength, timeout)
+        elapsed = time.perf_counter() - start
+        try:
+            request = self.requests(bRequest).name
+        except ValueError:
+            request = hex(bRequest)
+        self.stats.record("ctrl", request, self.tag(),
+                ret if isinstance(ret, int) else len(ret), elapsed)
+        return ret
+
+    def __getattr__(self, name):
+        return getattr(self.dev, name)
+
+
+class InstrumentedEndpoint():
+    def __init__(self, ep, stats, name, tag):
+        self.ep = ep
+        self.stats = stats
+        self.name = name
+        self.tag = tag
+
+    def read(self, size, timeout=None):
+        start = time.perf_counter()
+        ret = self.ep.read(size, timeout)
+        self.stats.record("in", self.name, self.tag(), len(ret),
+                time.perf_counter() - start)
+        return ret
+
+    def write(self, data, timeout=None):
+        start = time.perf_counter()
+        ret = self.ep.write(data, timeout)
+        self.stats.record("out", self.name, self.tag(), ret,
+                time.perf_counter() - start)
+        return ret
+
+    def __getattr__(self, name):
+        return getattr(self.ep, name)
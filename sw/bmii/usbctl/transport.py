@@ -0,0 +1,102 @@
+import logging
+import usb
+
+
+def device_path(dev):
+    ports = getattr(dev, "port_numbers", None)
+    if not ports:
+        return "{}:{}".format(dev.bus, dev.address)
+    return "{}-{}".format(dev.bus, ".".join([str(p) for p in ports]))
+
+
+def device_serial(dev):
+    if not dev.iSerialNumber:
+        return None
+    try:
+        return usb.util.get_string(dev, dev.iSerialNumber)
+    except (usb.core.USBError, ValueError):
+        return None
+
+
+def match_device(dev, selector):
+    # A board is selected by USB port path ("1-2.3", stable across
+    # firmware reloads), by bus and address ("1:17"), or by serial number
+    if selector is None:
+        return True
+    if selector == device_path(dev):
+        return True
+    bus, sep, address = selector.partition(":")
+    if sep and bus.isdigit() and address.isdigit():
+        return (int(bus), int(address)) == (dev.bus, dev.address)
+    return selector == device_serial(dev)
+
+
+def find_devices(idVendor=0xffff, idProduct=0xebfe, selector=None):
+    return [dev for dev in usb.core.find(find_all=True, idVendor=idVendor,
+        idProduct=idProduct) if match_device(dev, selector)]
+
+
+def list_devices(idVendor=0xffff, idProduct=0xebfe):
+    return [{
+        "bus": dev.bus,
+        "address": dev.address,
+        "path": device_path(dev),
+        "serial": device_serial(dev),
+    } for dev in find_devices(idVendor, idProduct)]
+
+
+class Transport():
+    verify_idcode = True
+
+    def open(self):
+        raise NotImplementedError
+
+    def shadow(self):
+        return {}
+
+    def endpoint(self, addr):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class USBTransport(Transport):
+    def __init__(self, idVendor=0xffff, idProduct=0xebfe, device=None):
+        self.idVendor = idVendor
+        self.idProduct = idProduct
+        self.device = device
+        self.dev = None
+
+    def detect(self):
+        devs = find_devices(self.idVendor, self.idProduct, self.device)
+        if not devs:
+            if self.device is None:
+                raise IOError("Device not found")
+            raise IOError("Device {} not found".format(self.device))
+        dev = devs[0]
+        if len(devs) > 1:
+            logging.warning("%d devices found, using %s (select one with --device)",
+                    len(devs), device_path(dev))
+        logging.info("Found device (%03d:%03d)", dev.bus, dev.address)
+        return dev
+
+    def open(self):
+        self.dev = self.detect()
+        self.dev.set_configuration()
+        return self.dev
+
+    def endpoint(self, addr):
+        cfg = self.dev.get_active_configuration()
+        intf = cfg[(0, 0)]
+        ep = usb.util.find_descriptor(
+                intf,
+                custom_match = \
+                        lambda e: e.bEndpointAddress == addr)
+        assert ep is not None
+        return ep
+
+    def close(self):
+        if self.dev is not None:
+            usb.util.dispose_resources(self.dev)
+            self.dev = None
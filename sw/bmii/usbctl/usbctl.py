@@ -1,8 +1,16 @@
 from bmii.usbctl.fw import BMIIFirmware, UBFirmware
 from bmii.usbctl.drv import Driver
+from bmii.usbctl.transport import USBTransport
 
 class USBCtl():
-    def __init__(self):
+    def __init__(self, device=None):
         self.fw = BMIIFirmware()
         self.ubfw = UBFirmware()
         self.drv = Driver()
+        self.set_device(device)
+
+    def set_device(self, device):
+        self.device = device
+        self.fw.device = device
+        self.ubfw.device = device
+        self.drv.set_transport(USBTransport(device=device))
@@ -24,11 +24,11 @@ class Demo(BMII):
             int(self.modules.southbridge.drv.PINSCANMISC.LED1) ^ 1
 
     def scan(self):
-        print([[int(self.modules.southbridge.drv.PINSCAN1L),
-                 int(self.modules.southbridge.drv.PINSCAN1H)],
-                [int(self.modules.southbridge.drv.PINSCAN2L),
-                 int(self.modules.southbridge.drv.PINSCAN2H)],
-                int(self.modules.southbridge.drv.PINSCANMISC)])
+        s = self.modules.southbridge.drv.snapshot("PINSCAN1L", "PINSCAN1H",
+                "PINSCAN2L", "PINSCAN2H", "PINSCANMISC")
+        print([[s["PINSCAN1L"], s["PINSCAN1H"]],
+                [s["PINSCAN2L"], s["PINSCAN2H"]],
+                s["PINSCANMISC"]])
 
     def get_pb_state(self):
         print(self.modules.southbridge.drv.PINSCANMISC.SW == 0)
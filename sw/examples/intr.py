@@ -38,8 +38,8 @@ class IntPushButtonIOModule(IOModule):
         pressed = Signal()
         released = Signal()
 
-        self.submodules.pressed = LevelToPulse(~self.iosignals.IN, pressed)
-        self.submodules.released = NLevelToPulse(~self.iosignals.IN, released)
+        self.submodules.pressed = FallingEdge(self.iosignals.IN, pressed)
+        self.submodules.released = FallingEdge(~self.iosignals.IN, released)
 
         self.intrs += IntRequest("PRESSED", pressed)
         self.intrs += IntRequest("RELEASED", released)